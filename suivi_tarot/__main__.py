@@ -1,25 +1,30 @@
 """Point d'entrée du programme. Actions :
 - Lance la création d'une bdd s'il elle n'est pas trouvé
-- Affiche la fenêtre principale du programme"""
+- Affiche la fenêtre principale du programme
+- Met à jour la bdd et enregistre les parties en attente une fois la fenêtre affichée"""
 
 import sys
 from pathlib import Path
 
+from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QApplication
 
-from suivi_tarot.window.db_connection import BddWindow
 from suivi_tarot.api.utils import SETTINGS_FILE
 from suivi_tarot.api.settings import create_settings_file, get_path_database
 
 
 def init_app(application: QApplication, message: str, path_default: Path = ""):
     """Lance la fenêtre de connexion de l'application à une base de données"""
+    from suivi_tarot.window.db_connection import BddWindow
+
     win = BddWindow(message, str(path_default))
     win.show()
     sys.exit(application.exec())
 
 
-if __name__ == '__main__':
+def main() -> int:
+    """Affiche la fenêtre principale, puis met à jour la bdd une fois la fenêtre affichée,
+    et retourne le code de sortie de l'application"""
     app = QApplication()
     if not SETTINGS_FILE.exists():
         create_settings_file()
@@ -29,8 +34,16 @@ if __name__ == '__main__':
     if not valid:
         init_app(app, "error", path)
 
+    from suivi_tarot.window.event_loop import install_event_loop, run_event_loop
     from suivi_tarot.window.main_window import MainWindow
 
+    install_event_loop(app)
     window = MainWindow()
     window.show()
-    sys.exit(app.exec())
+    # La connexion à la bdd (SQLAlchemy, migrations) attend le premier passage dans la boucle d'évènements
+    QTimer.singleShot(0, window.open_database)
+    return run_event_loop()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
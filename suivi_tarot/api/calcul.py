@@ -1,6 +1,13 @@
 from math import ceil, floor
 from enum import Enum
 
+import numpy as np
+
+from suivi_tarot.api.utils import HEAD
+
+# A incrémenter à chaque modification des règles de calcul : invalide les classements stockés
+SCORING_VERSION = 1
+
 
 class Contract(Enum):
     """Enumération des contrats possibles associés à leur coefficient"""
@@ -17,6 +24,32 @@ class Poignee(Enum):
     Triple = 40  # 13, 10 ou 8
 
 
+# Codes de stockage des attributs d'une donne : le code d'une valeur est sa position dans le tuple.
+# Les codes existants ne doivent pas changer, une nouvelle valeur s'ajoute en fin de tuple.
+DONNE_CODES = {"contract": (Contract.G, Contract.GS, Contract.GC),
+               "poignee": (None, Poignee.No, Poignee.Simple, Poignee.Double, Poignee.Triple),
+               "tete": ("", *HEAD),
+               "petit": ("", "Gagné", "Perdu"),
+               "petit_chelem": ("", "Oui"),
+               "grand_chelem": ("", "Réussi", "Réussi ss annonce", "Raté")}
+
+
+def encode_donne(attribute: str, value) -> int:
+    """Retourne le code de stockage de la valeur d'un attribut de donne. Une valeur absente (None ou "")
+    a le code 0 pour les attributs facultatifs ; toute autre valeur inconnue lève une ValueError."""
+    codes = DONNE_CODES[attribute]
+    if value in codes:
+        return codes.index(value)
+    if value in (None, "") and codes[0] in (None, ""):
+        return 0
+    raise ValueError(f"Valeur inconnue pour {attribute} : {value!r}")
+
+
+def decode_donne(attribute: str, code: int):
+    """Retourne la valeur d'un attribut de donne correspondant à son code de stockage"""
+    return DONNE_CODES[attribute][code]
+
+
 def conversion_contract(choix_contrat: str) -> Contract:
     """Retourne l'élément de la classe Contrat correspondant à la valeur textuelle"""
     for contrat in Contract:
@@ -113,6 +146,33 @@ def add_grand_chelem(annonce: str, sign: int) -> int:
     return value[annonce] * sign
 
 
+def calcul_donne_array(contract, nb_bout, point, poignee, petit_au_bout, petit_chelem, grand_chelem) -> np.ndarray:
+    """Version vectorisée de calcul_donne : chaque paramètre est une colonne (array NumPy
+    ou Series pandas) décrivant une donne par ligne, le contrat, la poignée, le petit au bout
+    et les chelems étant donnés par leur code de DONNE_CODES. Chaque bonus est lu dans une table
+    indexée par code, construite avec les fonctions de calcul_donne. Retourne le résultat
+    de chaque donne."""
+    point = np.asarray(point, dtype=float)
+
+    def bonus(attribute: str, value, column) -> np.ndarray:
+        table = np.array([value(annonce) if annonce else 0 for annonce in DONNE_CODES[attribute]])
+        return table[np.asarray(column, dtype=int)]
+
+    coef = bonus("contract", contract_coef_value, contract)
+    target = np.array([target_value(str(bout)) for bout in range(4)])[np.asarray(nb_bout, dtype=int)]
+    lost = point < target
+    sign = np.where(lost, -1, 1)
+    point = np.where(lost, np.floor(point), np.ceil(point)).astype(int)
+    result = (np.abs(target - point) + 25) * coef
+
+    result += bonus("poignee", add_poignee, poignee)
+    result += bonus("petit", lambda annonce: add_petit_au_bout(annonce, 1, 1), petit_au_bout) * coef * sign
+    result += bonus("petit_chelem", lambda annonce: add_petit_chelem(1), petit_chelem) * sign
+    result += bonus("grand_chelem", lambda annonce: add_grand_chelem(annonce, 1), grand_chelem) * sign
+
+    return result * sign
+
+
 def point_preneur_float(point: str, is_attack: bool) -> float:
     """Retourne les points de l'attaque convertis en float"""
     return float(point) if is_attack else 91 - float(point)
@@ -168,3 +228,47 @@ def repartition_points_by_player(donne: dict, player: str, table_of: int) -> int
             elif nickname in [donne['defense1'], donne['defense2']]:
                 return donne['result'] * -1
             return 0
+
+
+def repartition_points_matrix(donne, players: list, table_of: int, alone: tuple = ("Chien", "Solo")) -> np.ndarray:
+    """Version vectorisée de repartition_points_by_player : donne associe à chaque clé
+    (result, preneur, appele, pnj, defense1...) une colonne. Construit la matrice donne × joueur
+    des coefficients liés au rôle de chaque joueur puis retourne les points de tous
+    les joueurs pour chaque donne. Les joueurs peuvent être représentés par leur pseudo ou
+    leur id, alone contenant alors la même représentation de Chien et Solo."""
+    players = np.asarray(players, dtype=object)
+    result = np.asarray(donne["result"], dtype=int)
+
+    def has_role(role: str) -> np.ndarray:
+        return np.asarray(donne[role], dtype=object)[:, None] == players
+
+    is_defense = np.zeros((len(result), len(players)), dtype=bool)
+    for number in range(1, table_of):
+        is_defense |= has_role(f"defense{number}")
+
+    match table_of:
+        case 5:
+            appele = np.asarray(donne["appele"], dtype=object)
+            coef_preneur = np.where(np.logical_or.reduce([appele == player for player in alone]), 4, 2)[:, None]
+            coefficients = np.select([has_role("pnj"), has_role("appele"), has_role("preneur"), is_defense],
+                                     [0, 1, coef_preneur, -1])
+        case 4:
+            coefficients = np.select([has_role("preneur"), is_defense], [3, -1])
+        case _:
+            coefficients = np.select([has_role("preneur"), is_defense], [2, -1])
+
+    return coefficients * result[:, None]
+
+
+if __name__ == '__main__':
+    # Vérification ligne à ligne de calcul_donne_array contre calcul_donne sur toutes les combinaisons
+    from itertools import product
+
+    donnes = list(product(Contract, range(4), [p / 2 for p in range(183)], [None, *Poignee],
+                          ["", "Gagné", "Perdu"], ["", "Oui"], ["", "Réussi", "Réussi ss annonce", "Raté"]))
+    expected = [calcul_donne(c, str(b), p, pg, pb, pc, gc) for c, b, p, pg, pb, pc, gc in donnes]
+    attributes = ["contract", None, None, "poignee", "petit", "petit_chelem", "grand_chelem"]
+    columns = [np.array([encode_donne(attribute, value) for value in column]) if attribute else np.array(column)
+               for attribute, column in zip(attributes, zip(*donnes))]
+    assert calcul_donne_array(*columns).tolist() == expected
+    print(f"{len(donnes)} donnes vérifiées")
@@ -0,0 +1,114 @@
+"""Registre des points (table point_donne) : une ligne par donne et par joueur y ayant participé,
+avec les points qu'il y a marqués. S'y ajoute, par nombre de joueurs, le total cumulé de chaque
+joueur à l'issue de chaque partie (table point_snapshot), qui donne le classement d'une période
+sans parcourir ses parties, et le cumul mensuel de chaque joueur (table point_rollup), qui donne
+les totaux des périodes de period_dict en au plus 12 lignes par joueur. Tous sont alimentés à
+l'enregistrement de chaque partie ; pour les parties existantes, ils sont construits par
+la migration de la bdd (migrate) puis peuvent être reconstruits avec :
+python -m suivi_tarot.api.ledger"""
+
+from datetime import datetime
+
+import numpy as np
+
+from suivi_tarot.api.calcul import repartition_points_matrix
+from suivi_tarot.api.utils import period_dict
+from suivi_tarot.api.ranking_array import STREAM_CHUNK_SIZE, donne_arrays, result_donne
+from suivi_tarot.database.clients import DONNE_ROLES, get_game_donne_roles_columns, iter_donne_roles_columns, \
+    get_alone_id, insert_points_donne, delete_points_donne, get_points_per_game_player, insert_game_snapshot, \
+    insert_point_snapshots, delete_point_snapshots, get_snapshot_standings, get_points_per_month, add_point_rollups, \
+    delete_point_rollups, get_rollup_totals, game_data_transaction
+
+
+def points_donne(columns: dict[str, tuple], alone: tuple[int, int]) -> list[dict]:
+    """Retourne les lignes du registre correspondant à des donnes extraites colonne par colonne
+    avec l'id du joueur tenant chaque rôle"""
+    donne = donne_arrays(columns)
+    donne["result"] = result_donne(donne)
+    points = []
+    for table_of in np.unique(donne["table_"]).tolist():
+        in_table = donne["table_"] == table_of
+        table_donne = {name: column[in_table] for name, column in donne.items()}
+        roles = np.stack([table_donne[role] for role in DONNE_ROLES], axis=1)
+        players = np.setdiff1d(roles, [-1, *alone])
+        player_points = repartition_points_matrix(table_donne, players, table_of, alone)
+        donne_index, player_index = np.nonzero((roles[:, :, None] == players).any(axis=1))
+        points += [{"donne_id": donne_id, "player_id": player_id, "points": value}
+                   for donne_id, player_id, value in zip(table_donne["id_donne"][donne_index].tolist(),
+                                                         players[player_index].tolist(),
+                                                         player_points[donne_index, player_index].tolist())]
+    return points
+
+
+def record_game_points(game_id: int):
+    """Alimente le registre avec les points de chaque donne d'une partie, puis les totaux cumulés
+    des joueurs à l'issue de la partie et leurs cumuls du mois. A appeler dans la transaction
+    de l'enregistrement de la partie (game_data_transaction) : la partie et ses points sont
+    validés ensemble."""
+    insert_points_donne(points_donne(get_game_donne_roles_columns(game_id), get_alone_id()))
+    insert_game_snapshot(game_id)
+    add_point_rollups(get_points_per_month(game_id))
+
+
+def rebuild_ledger():
+    """Vide puis reconstruit le registre pour toutes les parties enregistrées, en une seule
+    transaction, les donnes étant lues par blocs par la session d'écriture"""
+    alone = get_alone_id()
+    with game_data_transaction():
+        delete_points_donne()
+        for columns in iter_donne_roles_columns(datetime.min, datetime.max, None, STREAM_CHUNK_SIZE, writer=True):
+            insert_points_donne(points_donne(columns, alone))
+        rebuild_snapshots()
+        rebuild_rollups()
+
+
+def rebuild_snapshots():
+    """Vide puis recalcule, dans l'ordre chronologique des parties, les totaux cumulés
+    de chaque joueur par nombre de joueurs à partir du registre"""
+    delete_point_snapshots()
+    totals: dict[tuple[int, int], int] = {}
+    snapshots = []
+    for game_id, table_, date_, player_id, points in get_points_per_game_player():
+        totals[table_, player_id] = totals.get((table_, player_id), 0) + points
+        snapshots.append({"game_id": game_id, "player_id": player_id, "table_": table_, "date_": date_,
+                          "total": totals[table_, player_id]})
+    insert_point_snapshots(snapshots)
+
+
+def rebuild_rollups():
+    """Vide puis recalcule les cumuls mensuels à partir du registre"""
+    delete_point_rollups()
+    add_point_rollups(get_points_per_month())
+
+
+def get_standings(start_date: datetime, end_date: datetime, table_of: int) -> list[tuple[str, int]]:
+    """Retourne le score de chaque joueur sur une période, par ordre décroissant,
+    à partir des totaux cumulés"""
+    return sorted(get_snapshot_standings(start_date, end_date, table_of), key=lambda v: v[1], reverse=True)
+
+
+def get_standings_at(date_: datetime, table_of: int) -> list[tuple[str, int]]:
+    """Retourne le score de chaque joueur depuis sa première partie jusqu'à une date,
+    par ordre décroissant"""
+    return get_standings(datetime.min, date_, table_of)
+
+
+def get_period_totals(year: int, period: str, table_of: int) -> list[tuple[str, int, int, int]]:
+    """Retourne les quadruplets (pseudo, points, donnes, parties) d'une période de period_dict
+    ("janvier", "avril - juin"...) ou de toute l'année si period est vide, par points décroissants"""
+    first, last = period_dict[period] if period else (1, 12)
+    totals = get_rollup_totals((year, first), (year, last), table_of)
+    return sorted(totals, key=lambda v: v[1], reverse=True)
+
+
+def get_rolling_totals(year: int, month: int, table_of: int) -> list[tuple[str, int, int, int]]:
+    """Retourne les quadruplets (pseudo, points, donnes, parties) des 12 mois se terminant
+    par le mois donné, par points décroissants"""
+    first = (year - 1, month + 1) if month < 12 else (year, 1)
+    totals = get_rollup_totals(first, (year, month), table_of)
+    return sorted(totals, key=lambda v: v[1], reverse=True)
+
+
+if __name__ == '__main__':
+    rebuild_ledger()
+    print("Registre des points reconstruit")
@@ -0,0 +1,318 @@
+from datetime import datetime
+from functools import cached_property
+from typing import Iterator
+
+import numpy as np
+
+from suivi_tarot.database.clients import get_donne_roles_columns, iter_donne_roles_columns, \
+    get_distinct_player_id, get_game_players_id, get_alone_id, get_points_per_game, \
+    get_points_per_game_sql
+from suivi_tarot.api.calcul import calcul_donne_array, repartition_points_matrix
+from suivi_tarot.api.utils import get_periods_of_year
+
+
+DONNE_DTYPES = {"id_game": np.int32,
+                "id_donne": np.int32,
+                "date_": "datetime64[us]",
+                "table_": np.int8,
+                "contract": np.int8,
+                "nb_bout": np.int8,
+                "point": float,
+                "petit": np.int8,
+                "poignee": np.int8,
+                "petit_chelem": np.int8,
+                "grand_chelem": np.int8,
+                "preneur": np.int32,
+                "appele": np.int32,
+                "pnj": np.int32,
+                "defense1": np.int32,
+                "defense2": np.int32,
+                "defense3": np.int32,
+                "defense4": np.int32}
+
+STREAM_CHUNK_SIZE = 1000
+
+
+def donne_arrays(columns: dict[str, tuple]) -> dict[str, np.ndarray]:
+    """Convertit les colonnes de donnes extraites de la bdd en arrays NumPy compacts"""
+    return {name: np.array(columns[name], dtype=dtype) for name, dtype in DONNE_DTYPES.items()}
+
+
+def result_donne(donne: dict[str, np.ndarray]) -> np.ndarray:
+    """Retourne le résultat de chaque donne"""
+    return calcul_donne_array(donne["contract"],
+                              donne["nb_bout"],
+                              donne["point"],
+                              donne["poignee"],
+                              donne["petit"],
+                              donne["petit_chelem"],
+                              donne["grand_chelem"])
+
+
+# noinspection PyAttributeOutsideInit
+class ArrayRanking:
+    """Equivalent de Ranking sans pandas : les donnes sont traitées sous forme de colonnes
+    NumPy et les joueurs identifiés par leur id. ranking est un tableau parties × joueurs
+    des scores cumulés, les colonnes suivant l'ordre de distinct_player."""
+
+    def __init__(self, start_date: datetime, end_date: datetime, table_of: int):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.table_of = table_of
+        self.data_extraction()
+        self.data_processing()
+
+    def data_extraction(self):
+        """Récupération des donnes, en colonnes, et des différents joueurs associés dans leurs rôles"""
+        self.player_extraction()
+        columns = get_donne_roles_columns(self.start_date, self.end_date, self.table_of)
+        self.donne = donne_arrays(columns)
+
+    def player_extraction(self):
+        """Récupère les joueurs de la période ainsi que l'id de Chien et Solo"""
+        players = get_distinct_player_id(self.start_date, self.end_date, self.table_of)
+        self.player_id = np.array([player_id for player_id, _ in players], dtype=np.int32)
+        self.distinct_player = [nickname for _, nickname in players]
+        self.alone = get_alone_id()
+
+    def data_processing(self):
+        """Traitement des données"""
+        self.calcul_base_donne()
+        self.distribution_of_points()
+        self.cumulative_points_per_game()
+
+    def calcul_base_donne(self):
+        """Calcul pour chaque donne le résultat"""
+        self.donne["result"] = result_donne(self.donne)
+
+    def distribution_of_points(self):
+        """Calcul les points de chaque joueur pour chaque donne"""
+        self.points = repartition_points_matrix(self.donne, self.player_id, self.table_of, self.alone)
+
+    def cumulative_points_per_game(self):
+        """Création du tableau représentant le cumul des scores de chaque joueur
+        par partie, les parties étant ordonnées par id"""
+        games, game_index = np.unique(self.donne["id_game"], return_inverse=True)
+        cumul = np.zeros((len(games), len(self.distinct_player)), dtype=np.int64)
+        np.add.at(cumul, game_index, self.points)
+        self.ranking: np.ndarray = cumul.cumsum(axis=0)
+
+    @property
+    def number_of_game(self) -> int:
+        """Nombre de parties trouvées"""
+        return self.ranking.shape[0]
+
+    def ranking_per_player(self) -> dict[str, list[int]]:
+        """Retourne pour chaque joueur la liste de ses scores cumulés partie après partie"""
+        return {player: self.ranking[:, i].tolist() for i, player in enumerate(self.distinct_player)}
+
+    def standings(self) -> list[tuple[str, int]]:
+        """Retourne le score final de chaque joueur, par ordre décroissant"""
+        final = self.ranking[-1].tolist() if self.number_of_game else [0] * len(self.distinct_player)
+        return sorted(zip(self.distinct_player, final), key=lambda v: v[1], reverse=True)
+
+
+# noinspection PyAttributeOutsideInit
+class StreamRanking(ArrayRanking):
+    """Equivalent d'ArrayRanking lisant les donnes par blocs de chunk_size lignes, dans l'ordre
+    chronologique des parties. Seuls les totaux courants des joueurs sont conservés d'un bloc à
+    l'autre : la mémoire utilisée pour la lecture dépend de la taille des blocs et non de la
+    période. iter_games émet le classement cumulé au fil des parties ; ranking n'est calculé
+    qu'au premier accès."""
+
+    def __init__(self, start_date: datetime, end_date: datetime, table_of: int,
+                 chunk_size: int = STREAM_CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        super().__init__(start_date, end_date, table_of)
+
+    def data_extraction(self):
+        """Récupération des joueurs, les donnes étant lues au parcours de iter_games"""
+        self.player_extraction()
+
+    def data_processing(self):
+        """Aucun traitement à la création, les blocs sont traités au parcours de iter_games"""
+
+    def iter_games(self) -> Iterator[tuple[int, np.ndarray]]:
+        """Retourne au fil de la lecture l'id de chaque partie et le score cumulé de chaque
+        joueur (dans l'ordre de distinct_player) à l'issue de cette partie"""
+        totals = np.zeros(len(self.distinct_player), dtype=np.int64)
+        current_game = None
+        for columns in iter_donne_roles_columns(self.start_date, self.end_date, self.table_of, self.chunk_size):
+            donne = donne_arrays(columns)
+            donne["result"] = result_donne(donne)
+            points = repartition_points_matrix(donne, self.player_id, self.table_of, self.alone)
+            games = donne["id_game"]
+            starts = np.flatnonzero(np.r_[True, games[1:] != games[:-1]])
+            for game, game_points in zip(games[starts].tolist(), np.add.reduceat(points, starts, axis=0)):
+                if current_game is not None and game != current_game:
+                    yield current_game, totals.copy()
+                totals += game_points
+                current_game = game
+        if current_game is not None:
+            yield current_game, totals.copy()
+
+    @cached_property
+    def ranking(self) -> np.ndarray:
+        """Tableau parties × joueurs des scores cumulés"""
+        ranking = [totals for _, totals in self.iter_games()]
+        return np.array(ranking, dtype=np.int64).reshape(len(ranking), len(self.distinct_player))
+
+
+# noinspection PyAttributeOutsideInit
+class PeriodRanking(ArrayRanking):
+    """Classement d'une période calculé par PeriodsRanking"""
+
+    def __init__(self, start_date: datetime, end_date: datetime, table_of: int,
+                 distinct_player: list[str], ranking: np.ndarray):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.table_of = table_of
+        self.distinct_player = distinct_player
+        self.ranking = ranking
+
+
+# noinspection PyAttributeOutsideInit
+class GamePlayerExtraction:
+    """Extraction des joueurs partie par partie, commune aux classements découpant l'extraction
+    par période ou par table (PeriodsRanking, TablesRanking) : game_player associe à chaque
+    participation la date et la table de la partie ainsi que l'index du joueur"""
+
+    def player_extraction(self):
+        """Récupère les joueurs de chaque partie ainsi que l'id de Chien et Solo"""
+        game_players = get_game_players_id(self.start_date, self.end_date, self.table_of)
+        players = {player_id: nickname for _, _, player_id, nickname in game_players}
+        index = {player_id: i for i, player_id in enumerate(players)}
+        self.player_id = np.array(list(players), dtype=np.int32)
+        self.distinct_player = list(players.values())
+        self.alone = get_alone_id()
+        self.game_player = {"date_": np.array([date_ for date_, _, _, _ in game_players], dtype="datetime64[us]"),
+                            "table_": np.array([table_ for _, table_, _, _ in game_players], dtype=np.int8),
+                            "player": np.array([index[player_id] for _, _, player_id, _ in game_players], dtype=int)}
+
+
+# noinspection PyAttributeOutsideInit
+class PeriodsRanking(GamePlayerExtraction, ArrayRanking):
+    """Classements de plusieurs périodes, éventuellement chevauchantes, pour un nombre de joueurs.
+    Les donnes de l'intervalle couvrant toutes les périodes sont extraites et les points de chaque
+    partie calculés une seule fois ; chaque période ne fait ensuite que cumuler les parties qui la
+    composent. rankings associe à chaque période (début, fin) son classement."""
+
+    def __init__(self, table_of: int, periods: list[tuple[datetime, datetime]]):
+        self.periods = list(periods)
+        super().__init__(min(start for start, _ in self.periods),
+                         max(end for _, end in self.periods),
+                         table_of)
+
+    @classmethod
+    def of_year(cls, year: int, type_: str, table_of: int) -> "PeriodsRanking":
+        """Classements de chaque mois, trimestre ou semestre ("month", "quarter", "semester")
+        d'une année, ou de l'année entière ("year")"""
+        return cls(table_of, get_periods_of_year(year, type_))
+
+    def cumulative_points_per_game(self):
+        """Calcul les points de chaque partie puis le classement cumulé de chaque période,
+        restreint aux joueurs ayant participé à au moins une partie de la période"""
+        games, game_index = np.unique(self.donne["id_game"], return_inverse=True)
+        points_per_game = np.zeros((len(games), len(self.distinct_player)), dtype=np.int64)
+        np.add.at(points_per_game, game_index, self.points)
+        game_date = np.zeros(len(games), dtype="datetime64[us]")
+        game_date[game_index] = self.donne["date_"]
+        self.ranking: np.ndarray = points_per_game.cumsum(axis=0)
+
+        self.rankings: dict[tuple[datetime, datetime], PeriodRanking] = {}
+        for start, end in self.periods:
+            in_period = (game_date >= np.datetime64(start)) & (game_date <= np.datetime64(end))
+            players = np.unique(self.game_player["player"][(self.game_player["date_"] >= np.datetime64(start))
+                                                           & (self.game_player["date_"] <= np.datetime64(end))])
+            self.rankings[(start, end)] = PeriodRanking(start, end, self.table_of,
+                                                        [self.distinct_player[i] for i in players],
+                                                        points_per_game[in_period][:, players].cumsum(axis=0))
+
+
+# noinspection PyAttributeOutsideInit
+class TablesRanking(GamePlayerExtraction, ArrayRanking):
+    """Classements de chaque nombre de joueurs (3, 4 et 5) sur une période, à partir d'une seule
+    extraction de toutes les donnes séparées ensuite par table. rankings associe à chaque nombre
+    de joueurs son classement ; ranking et standings donnent en plus une vue cumulée toutes
+    tables confondues, les parties étant ordonnées par id."""
+
+    TABLES = (3, 4, 5)
+
+    def __init__(self, start_date: datetime, end_date: datetime):
+        super().__init__(start_date, end_date, None)
+
+    def distribution_of_points(self):
+        """Calcul les points de chaque joueur pour chaque donne selon les règles de sa table"""
+        self.points = np.zeros((len(self.donne["result"]), len(self.distinct_player)), dtype=np.int64)
+        for table_of in self.TABLES:
+            in_table = self.donne["table_"] == table_of
+            donne = {name: column[in_table] for name, column in self.donne.items()}
+            self.points[in_table] = repartition_points_matrix(donne, self.player_id, table_of, self.alone)
+
+    def cumulative_points_per_game(self):
+        """Calcul le classement cumulé de chaque table, restreint à ses joueurs, puis
+        celui de toutes les tables confondues"""
+        self.rankings: dict[int, PeriodRanking] = {}
+        for table_of in self.TABLES:
+            in_table = self.donne["table_"] == table_of
+            games, game_index = np.unique(self.donne["id_game"][in_table], return_inverse=True)
+            points_per_game = np.zeros((len(games), len(self.distinct_player)), dtype=np.int64)
+            np.add.at(points_per_game, game_index, self.points[in_table])
+            players = np.unique(self.game_player["player"][self.game_player["table_"] == table_of])
+            self.rankings[table_of] = PeriodRanking(self.start_date, self.end_date, table_of,
+                                                    [self.distinct_player[i] for i in players],
+                                                    points_per_game[:, players].cumsum(axis=0))
+
+        super().cumulative_points_per_game()
+
+
+# noinspection PyAttributeOutsideInit
+class LedgerRanking(ArrayRanking):
+    """Equivalent d'ArrayRanking lisant les points dans le registre point_donne : la bdd retourne
+    directement la somme des points de chaque joueur par partie, sans recalcul des donnes.
+    Le registre des parties enregistrées avant sa création est construit par la migration de la bdd."""
+
+    def data_extraction(self):
+        """Récupération des joueurs et de leurs points par partie"""
+        self.player_extraction()
+        self.points_per_game_columns(get_points_per_game(self.start_date, self.end_date, self.table_of))
+
+    def points_per_game_columns(self, columns: dict[str, tuple]):
+        """Conserve les points par partie des joueurs de la période"""
+        player_id = np.array(columns["player_id"], dtype=np.int32)
+        known = np.isin(player_id, self.player_id)
+        self.points_per_game = {"id_game": np.array(columns["id_game"], dtype=np.int32)[known],
+                                "player_id": player_id[known],
+                                "points": np.array(columns["points"], dtype=np.int64)[known]}
+
+    def data_processing(self):
+        """Création du tableau des scores cumulés de chaque joueur par partie,
+        les parties étant ordonnées par id"""
+        games, game_index = np.unique(self.points_per_game["id_game"], return_inverse=True)
+        player_order = np.argsort(self.player_id)
+        player_index = player_order[np.searchsorted(self.player_id, self.points_per_game["player_id"],
+                                                    sorter=player_order)]
+        cumul = np.zeros((len(games), len(self.distinct_player)), dtype=np.int64)
+        np.add.at(cumul, (game_index, player_index), self.points_per_game["points"])
+        self.ranking: np.ndarray = cumul.cumsum(axis=0)
+
+
+# noinspection PyAttributeOutsideInit
+class SqlRanking(LedgerRanking):
+    """Equivalent de LedgerRanking dont les points par partie sont calculés par SQLite à partir
+    des donnes, sans registre : le résultat de chaque donne et sa répartition selon les rôles
+    sont des expressions SQL générées à partir des règles de calcul."""
+
+    def data_extraction(self):
+        """Récupération des joueurs et de leurs points par partie"""
+        self.player_extraction()
+        self.points_per_game_columns(get_points_per_game_sql(self.start_date, self.end_date, self.table_of))
+
+
+if __name__ == '__main__':
+    nb = 4
+    depart = datetime(2022, 1, 1)
+    fin = datetime(2022, 3, 31)
+    rank = ArrayRanking(depart, fin, nb)
+    print(rank.ranking_per_player())
+    print(rank.number_of_game)
@@ -0,0 +1,82 @@
+"""Sélection et mise en cache des classements. Les moteurs de calcul respectent le même contrat
+(distinct_player, number_of_game, ranking_per_player) et produisent les mêmes scores :
+- "array" : ArrayRanking, colonnes NumPy et joueurs identifiés par leur id, sans pandas
+- "stream" : StreamRanking, comme "array" mais en lisant les donnes par blocs de taille bornée
+- "ledger" : LedgerRanking, comme "array" mais en sommant en SQL les points du registre point_donne
+- "sql" : SqlRanking, comme "ledger" mais en calculant les points des donnes en SQL, sans registre
+- "pandas" : Ranking, DataFrame pandas"""
+
+from datetime import datetime
+from functools import lru_cache
+
+from suivi_tarot.api.calcul import SCORING_VERSION
+from suivi_tarot.api.settings import get_ranking_engine
+from suivi_tarot.database.clients import get_data_generation, get_data_version, get_stored_ranking, \
+    insert_stored_ranking
+
+
+RANKING_CACHE_SIZE = 16
+
+
+class StoredRanking:
+    """Classement relu depuis la table ranking_cache, respectant le contrat des moteurs"""
+
+    def __init__(self, ranking: dict[str, list[int]]):
+        self.ranking = ranking
+        self.distinct_player = list(ranking)
+
+    @property
+    def number_of_game(self) -> int:
+        """Nombre de parties trouvées"""
+        return len(next(iter(self.ranking.values()), []))
+
+    def ranking_per_player(self) -> dict[str, list[int]]:
+        """Retourne pour chaque joueur la liste de ses scores cumulés partie après partie"""
+        return {player: list(scores) for player, scores in self.ranking.items()}
+
+
+def create_ranking(start_date: datetime, end_date: datetime, table_of: int, engine: str = ""):
+    """Retourne le classement d'une période calculé avec le moteur demandé, à défaut
+    celui défini dans settings.json. Les derniers classements calculés sont conservés
+    en mémoire jusqu'à l'enregistrement d'une nouvelle partie, donne ou rôle."""
+    return cached_ranking(start_date, end_date, table_of, engine or get_ranking_engine(), get_data_generation())
+
+
+@lru_cache(maxsize=RANKING_CACHE_SIZE)
+def cached_ranking(start_date: datetime, end_date: datetime, table_of: int, engine: str, data_generation: int):
+    """Retourne le classement d'une période. La génération des données fait partie de la clé
+    du cache : après une écriture en bdd, les entrées précédentes ne sont plus atteignables
+    et finissent évincées. A défaut, le classement est relu en bdd s'il y a été stocké avec
+    la même version des règles de calcul et des données, sinon il est calculé puis stocké."""
+    data_version = get_data_version()
+    stored = get_stored_ranking(start_date, end_date, table_of, SCORING_VERSION, data_version)
+    if stored is not None:
+        return StoredRanking(stored)
+
+    ranking = compute_ranking(start_date, end_date, table_of, engine)
+    insert_stored_ranking(start_date, end_date, table_of, SCORING_VERSION, data_version,
+                          ranking.ranking_per_player())
+    return ranking
+
+
+def compute_ranking(start_date: datetime, end_date: datetime, table_of: int, engine: str):
+    """Calcule le classement d'une période avec le moteur demandé. Seul le module du moteur
+    choisi est importé."""
+    match engine:
+        case "pandas":
+            from suivi_tarot.api.ranking import Ranking
+            return Ranking(start_date, end_date, table_of)
+        case "array":
+            from suivi_tarot.api.ranking_array import ArrayRanking
+            return ArrayRanking(start_date, end_date, table_of)
+        case "stream":
+            from suivi_tarot.api.ranking_array import StreamRanking
+            return StreamRanking(start_date, end_date, table_of)
+        case "ledger":
+            from suivi_tarot.api.ranking_array import LedgerRanking
+            return LedgerRanking(start_date, end_date, table_of)
+        case "sql":
+            from suivi_tarot.api.ranking_array import SqlRanking
+            return SqlRanking(start_date, end_date, table_of)
+        case other:
+            raise ValueError(f"Moteur de classement inconnu : {other}")
@@ -0,0 +1,90 @@
+"""File d'attente des parties à enregistrer : une partie validée est d'abord écrite dans un fichier
+du dossier save_queue, sur le disque local, puis enregistrée en bdd par un thread d'écriture.
+Le fichier n'est supprimé qu'une fois la partie et ses points enregistrés, dans une même
+transaction : une partie dont l'enregistrement a été interrompu (fermeture de l'application,
+bdd indisponible) est donc enregistrée au lancement suivant. Une partie dont l'enregistrement
+échouera à chaque tentative (fichier illisible, partie refusée par la bdd) est déplacée dans le
+dossier save_queue/failed pour ne pas bloquer les suivantes. Pour enregistrer les parties en attente :
+python -m suivi_tarot.api.save_queue"""
+
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+from suivi_tarot.api.utils import SAVE_QUEUE_FOLDER, SAVE_QUEUE_FAILED_FOLDER
+
+
+def enqueue_game(game: dict, players: list[str], donnes: list[tuple[dict, list[tuple[str, str, int]]]]) -> Path:
+    """Ecrit dans la file d'attente une partie à enregistrer (mêmes paramètres que insert_full_game)
+    et retourne le chemin de son fichier. Le fichier est écrit sur le disque avant d'être renommé :
+    il est complet dès qu'il apparaît dans la file."""
+    SAVE_QUEUE_FOLDER.mkdir(exist_ok=True)
+    path = SAVE_QUEUE_FOLDER / f"{game['date_']:%Y%m%d%H%M%S%f}.json"
+    temporary = path.with_suffix(".tmp")
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({"game": {**game, "date_": game["date_"].isoformat()},
+                   "players": players,
+                   "donnes": donnes}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    temporary.replace(path)
+    return path
+
+
+def get_pending_games() -> list[Path]:
+    """Retourne les fichiers des parties en attente d'enregistrement, dans l'ordre des parties"""
+    return sorted(SAVE_QUEUE_FOLDER.glob("*.json")) if SAVE_QUEUE_FOLDER.exists() else []
+
+
+def read_pending_game(path: Path) -> tuple[dict, list[str], list[tuple[dict, list[tuple[str, str, int]]]]]:
+    """Retourne les paramètres de insert_full_game d'une partie en attente"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = json.load(f)
+    game = {**content["game"], "date_": datetime.fromisoformat(content["game"]["date_"])}
+    donnes = [(values, [tuple(role) for role in roles]) for values, roles in content["donnes"]]
+    return game, content["players"], donnes
+
+
+def save_pending_game(path: Path) -> int:
+    """Enregistre en bdd, en une seule transaction, une partie en attente ainsi que ses points,
+    la retire de la file puis retourne son id. Une partie déjà enregistrée (même date) avant
+    une interruption l'a été avec ses points : elle n'est pas enregistrée une seconde fois."""
+    from suivi_tarot.api.ledger import record_game_points
+    from suivi_tarot.database.clients import add_full_game, get_game_id, game_data_transaction, write_lock
+
+    game, players, donnes = read_pending_game(path)
+    with write_lock:
+        game_id = get_game_id(game["date_"])
+        if game_id is None:
+            with game_data_transaction():
+                game_id = add_full_game(game, players, donnes)
+                record_game_points(game_id)
+    path.unlink()
+    return game_id
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """Indique si l'échec de l'enregistrement d'une partie se reproduira à chaque tentative :
+    fichier illisible ou incomplet, joueur inconnu ou contrainte de la bdd non respectée,
+    à la différence d'une bdd indisponible ou verrouillée"""
+    from sqlalchemy.exc import IntegrityError
+
+    return isinstance(error, (ValueError, KeyError, TypeError, IntegrityError))
+
+
+def set_aside_game(path: Path) -> Path:
+    """Déplace une partie de la file dans le dossier des parties en échec, où elle n'est plus
+    enregistrée automatiquement, et retourne son nouveau chemin"""
+    SAVE_QUEUE_FAILED_FOLDER.mkdir(parents=True, exist_ok=True)
+    return path.replace(SAVE_QUEUE_FAILED_FOLDER / path.name)
+
+
+if __name__ == '__main__':
+    for pending_game in get_pending_games():
+        try:
+            print(f"Partie {save_pending_game(pending_game)} enregistrée")
+        except Exception as error:
+            if not is_permanent_failure(error):
+                raise
+            print(f"Partie {pending_game.name} mise de côté dans {set_aside_game(pending_game).parent} : {error}")
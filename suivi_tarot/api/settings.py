@@ -1,14 +1,16 @@
 import json
 from pathlib import Path
 
-from suivi_tarot.api.utils import SETTINGS_FILE, COLOR_DEFAULT
+from suivi_tarot.api.utils import SETTINGS_FILE, COLOR_DEFAULT, RANKING_ENGINE_DEFAULT, SQLITE_PROFILE_DEFAULT
 
 
 def create_settings_file():
     """Creation of the settings.json file to store the database path
     and color list used for the game chart"""
     set_content_settings({"path_database": "",
-                          "player_color": COLOR_DEFAULT})
+                          "player_color": COLOR_DEFAULT,
+                          "ranking_engine": RANKING_ENGINE_DEFAULT,
+                          "sqlite_profile": SQLITE_PROFILE_DEFAULT})
 
 def get_content_settings() -> dict:
     """Retourne le contenu de settings.json"""
@@ -36,6 +38,18 @@ def check_presence_player_color_key() -> bool:
     """Returns true if the player_color key is present in settings.json"""
     return "player_color" in get_content_settings().keys()
 
+def get_ranking_engine() -> str:
+    """Retourne le moteur de calcul des classements ("array", "stream", "ledger", "sql" ou "pandas")"""
+    return get_content_settings().get("ranking_engine", RANKING_ENGINE_DEFAULT)
+
+def get_sqlite_profile() -> dict:
+    """Retourne les pragmas à appliquer à chaque connexion SQLite : ceux par défaut,
+    remplacés par ceux de la clé sqlite_profile de settings.json"""
+    profile = dict(SQLITE_PROFILE_DEFAULT)
+    if SETTINGS_FILE.exists():
+        profile.update(get_content_settings().get("sqlite_profile", {}))
+    return profile
+
 def get_path_database(extension: str) -> tuple[Path, bool]:
     """Retourne le chemin et sa validée de la base de données
     stocké dans settings.json"""
@@ -1,5 +1,6 @@
 import hashlib
 import uuid
+from datetime import datetime, timedelta
 from pathlib import Path
 from random import choice
 
@@ -7,6 +8,8 @@ CUR_FILE = Path(__file__)
 ROOT_FOLDER = CUR_FILE.parent.parent.parent
 DATA_FILE = ROOT_FOLDER / "db.sqlite3"
 SETTINGS_FILE = ROOT_FOLDER / "settings.json"
+SAVE_QUEUE_FOLDER = ROOT_FOLDER / "save_queue"
+SAVE_QUEUE_FAILED_FOLDER = SAVE_QUEUE_FOLDER / "failed"
 IMAGE_FOLDER = ROOT_FOLDER / "ressource" / "image"
 
 HEADER_3_4 = ["Preneur",
@@ -50,8 +53,44 @@ HEAD = ["R \u2665",  # cœur
         "D \u2663",
         "D \u2660"]
 
+period_dict = {"type": ["Mois", "Trimestre", "Semestre"],
+               "month": ["janvier", "février", "mars", "avril", "mai", "juin", "juillet", "août", "septembre",
+                         "octobre",
+                         "novembre", "décembre"],
+               "quarter": ["janvier - mars", "avril - juin", "juillet - septembre", "octobre - décembre"],
+               "semester": ["janvier - juin", "juillet - décembre"],
+               "janvier": [1, 1],
+               "février": [2, 2],
+               "mars": [3, 3],
+               "avril": [4, 4],
+               "mai": [5, 5],
+               "juin": [6, 6],
+               "juillet": [7, 7],
+               "août": [8, 8],
+               "septembre": [9, 9],
+               "octobre": [10, 10],
+               "novembre": [11, 11],
+               "décembre": [12, 12],
+               "janvier - mars": [1, 3],
+               "avril - juin": [4, 6],
+               "juillet - septembre": [7, 9],
+               "octobre - décembre": [10, 12],
+               "janvier - juin": [1, 6],
+               "juillet - décembre": [7, 12]}
+
 PLAYERS = ["Romain", "Ludo", "Emeline", "Eddy", "Aurore"]
 
+RANKING_ENGINE_DEFAULT = "array"
+
+# Pragmas appliqués à chaque connexion SQLite. WAL + synchronous NORMAL : lectures concurrentes
+# des écritures et un seul fsync par checkpoint, sans risque de corruption (seule la dernière
+# transaction peut être perdue en cas de coupure). cache_size négatif : taille en Kio.
+SQLITE_PROFILE_DEFAULT = {"journal_mode": "WAL",
+                          "synchronous": "NORMAL",
+                          "cache_size": -65536,
+                          "mmap_size": 268435456,
+                          "temp_store": "MEMORY"}
+
 COLOR_DEFAULT = ['#0000ff', '#ff8c00', '#008000', '#ff0000', '#800080', '#800000']
 
 COLOR_PREDEFINED = {'White': '#ffffff',
@@ -215,6 +254,24 @@ def get_random_item_with_constraint(list_str: list[str], prohibited_item: str) -
     return item
 
 
+def get_first_and_last_day_of_period(period: str, year: int) -> tuple[datetime, datetime]:
+    """Retourne au format datetime le premier et le dernier jour d'une période"""
+    start, end = period_dict.get(period)
+    start = datetime(year, start, 1)
+    end = datetime(year, end, 28, 23, 59, 59)
+    next_month = end + timedelta(days=4)
+    end = next_month - timedelta(days=next_month.day)
+    return start, end
+
+
+def get_periods_of_year(year: int, type_: str) -> list[tuple[datetime, datetime]]:
+    """Retourne le premier et le dernier jour de chaque période ("month", "quarter" ou "semester"
+    de period_dict, ou "year") d'une année"""
+    if type_ == "year":
+        return [(datetime(year, 1, 1, 0, 0, 0), datetime(year, 12, 31, 23, 59, 59))]
+    return [get_first_and_last_day_of_period(period, year) for period in period_dict[type_]]
+
+
 def generate_salt() -> str:
     """Retourne une chaîne de caractères unique"""
     return str(uuid.uuid4())
@@ -0,0 +1,89 @@
+"""Version asynchrone (asyncio) des lectures de clients.py : chaque lecture est exécutée dans un
+thread de lecture et attendue par la boucle asyncio, intégrée à celle de Qt par
+suivi_tarot.window.event_loop. Les fenêtres attendent ainsi leurs données sans se figer
+et peuvent lancer plusieurs lectures indépendantes en même temps (asyncio.gather)."""
+
+import asyncio
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable
+
+import suivi_tarot.database.models as md
+from suivi_tarot.database import clients
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+# Nombre de lectures simultanées : reste inférieur au pool de connexions du moteur de lecture,
+# dont une connexion peut être prise par le thread de l'interface et une par le calcul des classements
+READ_WORKERS = 2
+read_executor = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix="read")
+
+
+def run_read(read: Callable, *args):
+    """Exécute une lecture puis rend au pool les connexions prises par le thread de lecture"""
+    try:
+        return read(*args)
+    finally:
+        md.read_session.remove()
+        md.session.remove()
+
+
+async def read_async(read: Callable, *args):
+    """Exécute une lecture de clients.py dans un thread de lecture et retourne son résultat"""
+    return await asyncio.get_running_loop().run_in_executor(read_executor, run_read, read, *args)
+
+
+async def get_all_players() -> list[str]:
+    """Retourne la liste de tous les joueurs"""
+    return await read_async(clients.get_all_players)
+
+
+async def get_active_players() -> list[str]:
+    """Retourne la liste des joueurs actifs"""
+    return await read_async(clients.get_active_players)
+
+
+async def get_inactive_players() -> list[str]:
+    """Retourne la liste des joueurs inactifs"""
+    return await read_async(clients.get_inactive_players)
+
+
+async def get_distinct_years() -> list[str]:
+    """Retourne la liste des années en ordre decroissant où au moins une partie a été jouée"""
+    return await read_async(clients.get_distinct_years)
+
+
+async def get_min_max_dates_games() -> tuple[datetime.datetime | None, datetime.datetime | None]:
+    """Retourne les dates de la première et de la dernière partie enregistrée (None si bdd vide)"""
+    return await read_async(clients.get_min_max_dates_games)
+
+
+async def get_donne(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> "pd.DataFrame":
+    """Retourne un DataFrame de toutes les parties et donnes jouées dans une période donnée
+    et pour un nombre de joueurs"""
+    return await read_async(clients.get_donne, start_date, end_date, nombre_joueurs)
+
+
+async def get_donne_roles_columns(start_date: datetime, end_date: datetime,
+                                  nombre_joueurs: int | None) -> dict[str, tuple]:
+    """Retourne, colonne par colonne, toutes les donnes jouées dans une période donnée et pour
+    un nombre de joueurs, avec l'id du joueur tenant chaque rôle (-1 si absent)"""
+    return await read_async(clients.get_donne_roles_columns, start_date, end_date, nombre_joueurs)
+
+
+async def get_game_players_id(start_date: datetime, end_date: datetime,
+                              nombre_joueurs: int | None) -> list[tuple[datetime.datetime, int, int, str]]:
+    """Retourne les quadruplets (date de la partie, nombre de joueurs de la table, id joueur, pseudo)
+    des joueurs ayant participé aux parties jouées dans une période donnée, dans l'ordre des parties"""
+    return await read_async(clients.get_game_players_id, start_date, end_date, nombre_joueurs)
+
+
+if __name__ == '__main__':
+    async def main():
+        years, dates, players = await asyncio.gather(get_distinct_years(), get_min_max_dates_games(),
+                                                     get_active_players())
+        print(years, dates, players)
+
+    asyncio.run(main())
@@ -1,17 +1,85 @@
 import datetime
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Callable, Iterator
 
-import pandas as pd
-from sqlalchemy import select, update, and_, func, between
+from sqlalchemy import select, insert, update, delete, and_, or_, func, between, case, cast, Integer, Select, Result
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 import suivi_tarot.database.models as md
-from suivi_tarot.api.utils import hashage_password, move_database
+from suivi_tarot.api.calcul import DONNE_CODES, contract_coef_value, target_value, add_poignee, add_petit_au_bout, \
+    add_petit_chelem, add_grand_chelem, distribution_point_between_attack_defense
+from suivi_tarot.api.utils import DATA_FILE, hashage_password, move_database
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+data_generation = 0
+
+# Un seul thread écrit à la fois : les écritures des sessions de chaque thread sont sérialisées par ce verrou,
+# les lectures des calculs passant par les connexions en lecture seule de md.read_session
+write_lock = threading.RLock()
+
+# Correspondance pseudo <-> id des joueurs, chargée au premier accès
+player_ids: dict[str, int] = {}
+player_nicknames: dict[int, str] = {}
+
+
+def commit_game_data():
+    """Valide l'écriture d'une partie, d'une donne ou d'un rôle et incrémente le compteur
+    de génération des données, ce qui invalide les classements mis en cache"""
+    global data_generation
+    with write_lock:
+        md.session.commit()
+        data_generation += 1
+
+
+def get_data_generation() -> int:
+    """Retourne le compteur de génération des données de parties"""
+    return data_generation
+
+
+@contextmanager
+def game_data_transaction():
+    """Regroupe les écritures du bloc (partie, registre des points) dans une seule transaction,
+    validée en fin de bloc par commit_game_data et entièrement annulée en cas d'erreur"""
+    with write_lock:
+        try:
+            yield
+            commit_game_data()
+        except Exception:
+            md.session.rollback()
+            raise
+
+
+@contextmanager
+def interruptible(cancelled: Callable[[], bool]):
+    """Interrompt les requêtes de lecture (md.read_session) exécutées dans le bloc par le thread
+    courant dès que cancelled() retourne vrai : sqlite lève alors une erreur "interrupted"
+    et la transaction est annulée. La connexion est rendue au pool en fin de bloc."""
+    connection = md.read_session.connection().connection.driver_connection
+    connection.set_progress_handler(cancelled, 1000)
+    try:
+        yield
+    except Exception:
+        md.read_session.rollback()
+        raise
+    finally:
+        connection.set_progress_handler(None, 1000)
+        md.read_session.close()
 
 
 def init_bdd(path: str, password: str):
     """Création de la base de données, insertion des joueurs
     non jouables Chien et Solo utilent aux parties à 5 et 6 joueurs
     ainsi que le hash du mot de passe et son sel"""
-    md.Base.metadata.create_all(md.engine)
+    from suivi_tarot.database.migrations import SCHEMA_VERSION, set_schema_version
+
+    md.configure(DATA_FILE)
+    md.Base.metadata.create_all(md.get_engine())
+    set_schema_version(SCHEMA_VERSION)
+    insert_donne_codes()
 
     insert_new_player({'nickname': 'Chien', 'active': False, 'protect': True})
     insert_new_player({'nickname': 'Solo', 'active': False, 'protect': True})
@@ -19,86 +87,113 @@ def init_bdd(path: str, password: str):
     hash_, salt = hashage_password(password)
     insert_hash_password({"hash_": hash_, "salt": salt})
 
-    md.session.close()
+    # Ferme les connexions pour que le journal WAL soit intégré au fichier avant son déplacement
+    md.dispose()
     move_database(path)
 
 
-def insert_hash_password(password):
-    """Insère le hash du mot de passe et le sel associé"""
-    md.session.add(md.Password(**password))
-    md.session.commit()
-
-
-def insert_new_game(**game) -> int:
-    """Insère les données d'une partie ainsi que les donnes associées"""
-    game = md.Game(**game)
-    md.session.add(game)
-    md.session.commit()
-    return game.id_game
+def insert_donne_codes():
+    """Insère la table de correspondance entre les codes des attributs de donne et leur libellé"""
+    codes = [{"attribute": attribute, "code": code, "label": getattr(value, "name", value or "")}
+             for attribute, values in DONNE_CODES.items()
+             for code, value in enumerate(values)]
+    with write_lock:
+        md.session.execute(insert(md.DonneCode), codes)
+        md.session.commit()
 
 
-def insert_players_game(game_id: int, players: list[str]):
-    """Insère l'id des joueurs ayant participé à une partie dans la
-    table de jointure partie_joueur"""
-    for player in players:
-        player_id = get_player_id(player)
-        game_player = md.GamePlayer(game_id=game_id, player_id=player_id)
-        md.session.add(game_player)
-    md.session.commit()
+def create_missing_tables():
+    """Crée les tables absentes d'une bdd existante (ajoutées par une version plus récente)"""
+    md.Base.metadata.create_all(md.get_engine())
 
 
-def insert_donne(donne: md.Donne) -> int:
-    """Insère une donne dans la bdd et retourne son id
-    généré automatiquement"""
-    md.session.add(donne)
-    md.session.commit()
-    return donne.id_donne
-
-
-def insert_preneur(donne_id: int, nickname: str):
-    """Enregistre en bdd l'id du joueur ayant participé à une donne
-    comme preneur"""
-    joueur_id = get_player_id(nickname)
-    md.session.add(md.Preneur(donne_id=donne_id, player_id=joueur_id))
-    md.session.commit()
-
-
-def insert_appele(donne_id: int, nickname: str):
-    """Enregistre en bdd l'id du joueur ayant participé à une donne
-    comme appele (partie à 5 ou 6 joueurs uniquement)"""
-    player_id = get_player_id(nickname)
-    md.session.add(md.Appele(donne_id=donne_id, player_id=player_id))
-    md.session.commit()
+def insert_hash_password(password):
+    """Insère le hash du mot de passe et le sel associé"""
+    with write_lock:
+        md.session.add(md.Password(**password))
+        md.session.commit()
+
+
+def insert_full_game(game: dict, players: list[str], donnes: list[tuple[dict, list[tuple[str, str, int]]]]) -> int:
+    """Enregistre en une seule transaction une partie, ses joueurs, ses donnes et les rôles de
+    chaque donne, puis retourne l'id de la partie. Tout est annulé en cas d'erreur."""
+    with game_data_transaction():
+        return add_full_game(game, players, donnes)
+
+
+def add_full_game(game: dict, players: list[str], donnes: list[tuple[dict, list[tuple[str, str, int]]]]) -> int:
+    """Ajoute à la transaction en cours (game_data_transaction) une partie, ses joueurs, ses donnes
+    et les rôles de chaque donne, puis retourne l'id de la partie.
+    game : {'date_': datetime, 'table_': int}, donnes : couples (valeurs de la donne, rôles sous
+    forme de triplets (pseudo, rôle, place), rôle parmi preneur, appele, pnj et defense, place
+    numérotant les défenseurs à partir de 1 et valant 0 pour les autres rôles)"""
+    nicknames = set(players) | {nickname for _, roles in donnes for nickname, _, _ in roles}
+    player_id = get_players_id(nicknames)
+    new_game = md.Game(**game)
+    md.session.add(new_game)
+    md.session.flush()
+    md.session.execute(insert(md.GamePlayer),
+                       [{"game_id": new_game.id_game, "player_id": player_id[player]} for player in players])
+    new_donnes = [md.Donne(game_id=new_game.id_game, **values) for values, _ in donnes]
+    md.session.add_all(new_donnes)
+    md.session.flush()
+    participations = [{"donne_id": donne.id_donne, "player_id": player_id[nickname], "role": role, "seat": seat}
+                      for donne, (_, roles) in zip(new_donnes, donnes)
+                      for nickname, role, seat in roles]
+    md.session.execute(insert(md.Participation), participations)
+    return new_game.id_game
+
+
+def load_player_ids():
+    """Charge en mémoire, en une seule requête, la correspondance pseudo <-> id de tous les joueurs"""
+    players = dict(md.session.execute(select(md.Player.nickname, md.Player.id_player)).all())
+    # Complétée sans être vidée : un autre thread peut la lire pendant le chargement
+    player_ids.update(players)
+    player_nicknames.update({player_id: nickname for nickname, player_id in players.items()})
+
+
+def clear_player_ids():
+    """Vide la correspondance pseudo <-> id, rechargée au prochain accès (changement de bdd)"""
+    player_ids.clear()
+    player_nicknames.clear()
+
+
+def get_players_id(nicknames: set[str]) -> dict[str, int]:
+    """Retourne l'id de chaque joueur en fonction de son pseudo"""
+    return {nickname: get_player_id(nickname) for nickname in nicknames}
 
 
-def insert_pnj(donne_id: int, nickname: str):
-    """Enregistre en bdd l'id du joueur ayant participé à une donne
-    comme pnj (partie à 6 joueurs uniquement)"""
-    player_id = get_player_id(nickname)
-    md.session.add(md.Pnj(donne_id=donne_id, player_id=player_id))
-    md.session.commit()
+def get_player_id(nickname: str) -> int:
+    """Retourne l'id d'un joueur en fonction de son pseudo. La correspondance est gardée en
+    mémoire et rechargée si le pseudo est inconnu (joueur ajouté par une autre instance)"""
+    if nickname not in player_ids:
+        load_player_ids()
+    return player_ids[nickname]
 
 
-def insert_defense(donne_id: int, nickname: str, number: int):
-    """Enregistre en bdd l'id du joueur ayant participé à une donne
-    comme defenseur"""
-    player_id = get_player_id(nickname)
-    md.session.add(md.Defense(donne_id=donne_id, player_id=player_id, number=number))
-    md.session.commit()
+def get_player_nickname(player_id: int) -> str:
+    """Retourne le pseudo d'un joueur en fonction de son id"""
+    if player_id not in player_nicknames:
+        load_player_ids()
+    return player_nicknames[player_id]
 
 
-def get_player_id(nickname: str) -> int:
-    """Retourne l'id d'un joueur en fonction de son pseudo"""
-    statement = select(md.Player.id_player).where(md.Player.nickname == nickname)
-    player_id = md.session.execute(statement).first()
-    return player_id[0]
+def get_alone_id() -> tuple[int, int]:
+    """Retourne l'id des joueurs non jouables Chien et Solo"""
+    return get_player_id("Chien"), get_player_id("Solo")
 
 
 def insert_new_player(player: dict):
     """Insertion en bdd d'un joueur. Dictionnaire du type :
     {'pseudo': str, 'nom': str|None, 'prenom': str|None, 'actif': bool, 'protege': bool}"""
-    md.session.add(md.Player(**player))
-    md.session.commit()
+    with write_lock:
+        new_player = md.Player(**player)
+        md.session.add(new_player)
+        md.session.flush()
+        nickname, player_id = new_player.nickname, new_player.id_player
+        md.session.commit()
+        player_ids[nickname] = player_id
+        player_nicknames[player_id] = nickname
 
 
 def get_all_players() -> list[str]:
@@ -128,11 +223,12 @@ def get_inactive_players() -> list[str]:
 def update_status_joueurs(status_player: dict):
     """Met à jour le champ actif d'un ou plusieurs joueurs
     à partir d'un dictionnaire du type {"pseudo": bool}"""
-    for nickname, status in status_player.items():
-        statement = update(md.Player).where(md.Player.nickname == nickname).values(active=status). \
-            execution_options(synchronize_session='fetch')
-        md.session.execute(statement)
-    md.session.commit()
+    with write_lock:
+        for nickname, status in status_player.items():
+            statement = update(md.Player).where(md.Player.id_player == get_player_id(nickname)).values(active=status). \
+                execution_options(synchronize_session='fetch')
+            md.session.execute(statement)
+        md.session.commit()
 
 
 def get_distinct_years() -> list[str]:
@@ -152,83 +248,440 @@ def get_min_max_dates_games() -> tuple[datetime.datetime | None, datetime.dateti
     return query[0][0], query[0][1]
 
 
-def get_donne(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> pd.DataFrame:
+def get_game_id(date_: datetime.datetime) -> int | None:
+    """Retourne l'id de la partie enregistrée à une date, None si elle n'existe pas"""
+    return md.session.execute(select(md.Game.id_game).where(md.Game.date_ == date_)).scalar()
+
+
+DONNE_ROLES = {"preneur": ("preneur", 0),
+               "appele": ("appele", 0),
+               "pnj": ("pnj", 0),
+               "defense1": ("defense", 1),
+               "defense2": ("defense", 2),
+               "defense3": ("defense", 3),
+               "defense4": ("defense", 4)}
+
+
+def game_filter(start_date: datetime, end_date: datetime, nombre_joueurs: int | None):
+    """Retourne le filtre des parties jouées dans une période donnée et pour un nombre
+    de joueurs, ou quel que soit le nombre de joueurs si nombre_joueurs est None"""
+    if nombre_joueurs is None:
+        return between(md.Game.date_, start_date, end_date)
+    return and_(between(md.Game.date_, start_date, end_date),
+                md.Game.table_ == nombre_joueurs)
+
+
+def select_donne(start_date: datetime, end_date: datetime, nombre_joueurs: int | None) -> Select:
+    """Retourne la requête de toutes les parties et donnes jouées dans une période donnée
+    et pour un nombre de joueurs (tous si None)"""
+    return select(md.Game.id_game,
+                  md.Game.date_,
+                  md.Game.table_,
+                  md.Donne.id_donne,
+                  md.Donne.contract,
+                  md.Donne.nb_bout,
+                  md.Donne.tete,
+                  md.Donne.point,
+                  md.Donne.petit,
+                  md.Donne.poignee,
+                  md.Donne.petit_chelem,
+                  md.Donne.grand_chelem) \
+        .join(md.Game).where(game_filter(start_date, end_date, nombre_joueurs))
+
+
+def get_donne(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> "pd.DataFrame":
     """Retourne un DataFrame de toutes les parties et donnes jouées dans une période donnée
     et pour un nombre de joueurs"""
-    query = select(md.Game.id_game,
-                   md.Game.date_,
-                   md.Game.table_,
-                   md.Donne.id_donne,
-                   md.Donne.contract,
-                   md.Donne.nb_bout,
-                   md.Donne.tete,
-                   md.Donne.point,
-                   md.Donne.petit,
-                   md.Donne.poignee,
-                   md.Donne.petit_chelem,
-                   md.Donne.grand_chelem) \
-        .join(md.Game).where(and_(between(md.Game.date_, start_date, end_date),
-                                  md.Game.table_ == nombre_joueurs))
-    return pd.read_sql_query(sql=query, con=md.engine, index_col="id_donne")
-
-
-def get_preneur(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> pd.DataFrame:
-    """Retourne un DataFrame de tous les joueurs ayant le rôle de preneur parmis les donnes jouées
-    dans une période donnée avec un certain nombre de joueurs"""
-    query = select(md.Donne.id_donne, md.Player.nickname).select_from(md.Player) \
-        .join(md.Preneur, md.Player.id_player == md.Preneur.player_id) \
-        .join(md.Donne, md.Preneur.donne_id == md.Donne.id_donne) \
+    import pandas as pd
+
+    query = select_donne(start_date, end_date, nombre_joueurs)
+    return pd.read_sql_query(sql=query, con=md.read_session.connection(), index_col="id_donne")
+
+
+def select_donne_roles(start_date: datetime, end_date: datetime, nombre_joueurs: int | None, by_id: bool) -> Select:
+    """Retourne la requête des donnes jouées dans une période donnée et pour un nombre de joueurs,
+    avec en colonne le joueur tenant chaque rôle (preneur, appele, pnj, defense1 à defense4).
+    Le joueur est représenté par son pseudo (None si le rôle est absent de la donne) ou,
+    si by_id est vrai, par son id (-1 si le rôle est absent). Chaque rôle est lu par une
+    sous-requête dans l'index unique (donne, rôle, place) de participation et les donnes sont
+    triées dans l'ordre des index des parties (date unique, puis id) et des donnes : sqlite
+    retourne les lignes au fil de la lecture, sans regroupement ni tri de toute la période."""
+    query = select_donne(start_date, end_date, nombre_joueurs)
+    for label, (role, seat) in DONNE_ROLES.items():
+        holder = select(md.Participation.player_id if by_id else md.Player.nickname) \
+            .select_from(md.Participation) \
+            .where(md.Participation.donne_id == md.Donne.id_donne,
+                   md.Participation.role == role,
+                   md.Participation.seat == seat)
+        if by_id:
+            query = query.add_columns(func.coalesce(holder.scalar_subquery(), -1).label(label))
+        else:
+            holder = holder.join(md.Player, md.Participation.player_id == md.Player.id_player)
+            query = query.add_columns(holder.scalar_subquery().label(label))
+    return query.order_by(md.Game.date_, md.Game.id_game, md.Donne.id_donne)
+
+
+def get_donne_roles(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> "pd.DataFrame":
+    """Retourne un DataFrame de toutes les donnes jouées dans une période donnée et pour un
+    nombre de joueurs, avec en colonne le pseudo du joueur tenant chaque rôle. Une seule
+    requête est exécutée, les pseudos étant retrouvés dans la correspondance en mémoire."""
+    import pandas as pd
+
+    query = select_donne_roles(start_date, end_date, nombre_joueurs, by_id=True)
+    donne = pd.read_sql_query(sql=query, con=md.read_session.connection(), index_col="id_donne")
+    for role in DONNE_ROLES:
+        donne[role] = donne[role].map(lambda player_id: get_player_nickname(player_id) if player_id != -1 else None)
+    return donne
+
+
+def get_donne_roles_columns(start_date: datetime, end_date: datetime, nombre_joueurs: int | None) -> dict[str, tuple]:
+    """Retourne, colonne par colonne, toutes les donnes jouées dans une période donnée et pour
+    un nombre de joueurs, avec l'id du joueur tenant chaque rôle (-1 si absent)"""
+    query = select_donne_roles(start_date, end_date, nombre_joueurs, by_id=True)
+    return result_columns(md.read_session.execute(query))
+
+
+def get_game_donne_roles_columns(game_id: int) -> dict[str, tuple]:
+    """Retourne, colonne par colonne, les donnes d'une partie avec l'id du joueur tenant
+    chaque rôle (-1 si absent)"""
+    query = select_donne_roles(datetime.datetime.min, datetime.datetime.max, None, by_id=True) \
+        .where(md.Game.id_game == game_id)
+    return result_columns(md.session.execute(query))
+
+
+def result_columns(result: Result) -> dict[str, tuple]:
+    """Retourne le résultat d'une requête colonne par colonne"""
+    keys = list(result.keys())
+    rows = result.all()
+    return dict(zip(keys, zip(*rows) if rows else [()] * len(keys)))
+
+
+def iter_donne_roles_columns(start_date: datetime, end_date: datetime, nombre_joueurs: int | None,
+                             chunk_size: int, writer: bool = False) -> Iterator[dict[str, tuple]]:
+    """Parcourt par blocs d'au plus chunk_size lignes, dans l'ordre des parties, les donnes
+    jouées dans une période donnée et pour un nombre de joueurs. Chaque bloc est retourné
+    colonne par colonne, avec l'id du joueur tenant chaque rôle (-1 si absent). La lecture se fait
+    par md.read_session (interruptible), ou par la session d'écriture si writer est vrai."""
+    query = select_donne_roles(start_date, end_date, nombre_joueurs, by_id=True)
+    session = md.session if writer else md.read_session
+    result = session.execute(query, execution_options={"yield_per": chunk_size})
+    keys = list(result.keys())
+    for rows in result.partitions():
+        yield dict(zip(keys, zip(*rows)))
+
+
+def code_lookup(column, attribute: str, value: Callable) -> case:
+    """Retourne l'expression SQL associant à chaque code d'un attribut de donne la valeur
+    calculée pour son libellé (0 pour le code sans annonce)"""
+    return case({code: value(annonce) if annonce else 0 for code, annonce in enumerate(DONNE_CODES[attribute])},
+                value=column, else_=0)
+
+
+def donne_result_expression():
+    """Retourne l'expression SQL du résultat d'une donne, identique à calcul_donne : chaque table
+    de valeurs (coefficient du contrat, cible selon les bouts, bonus) est générée à partir des
+    fonctions de calcul. Les points, positifs, sont arrondis par CAST (troncature)."""
+    coef = code_lookup(md.Donne.contract, "contract", contract_coef_value)
+    target = case({bout: target_value(str(bout)) for bout in range(4)}, value=md.Donne.nb_bout)
+    lost = md.Donne.point < target
+    sign = case((lost, -1), else_=1)
+    truncated = cast(md.Donne.point, Integer)
+    point = case((lost, truncated), else_=truncated + case((md.Donne.point > truncated, 1), else_=0))
+    result = (func.abs(target - point) + 25) * coef \
+        + code_lookup(md.Donne.poignee, "poignee", add_poignee) \
+        + code_lookup(md.Donne.petit, "petit", lambda annonce: add_petit_au_bout(annonce, 1, 1)) * coef * sign \
+        + code_lookup(md.Donne.petit_chelem, "petit_chelem", lambda annonce: add_petit_chelem(1)) * sign \
+        + code_lookup(md.Donne.grand_chelem, "grand_chelem", lambda annonce: add_grand_chelem(annonce, 1)) * sign
+    return result * sign
+
+
+def role_coefficient_expression():
+    """Retourne l'expression SQL du coefficient appliqué au résultat de la donne pour le joueur
+    d'une ligne de participation, généré à partir de distribution_point_between_attack_defense :
+    preneur, appelé (partie à 5), défense (-1) ou pnj (0). Le coefficient du preneur dépend de
+    l'appel de Chien ou Solo."""
+    alone = select(md.Participation.id_participation) \
+        .join(md.Player, md.Participation.player_id == md.Player.id_player) \
+        .where(md.Participation.donne_id == md.Donne.id_donne,
+               md.Participation.role == "appele",
+               md.Player.nickname.in_(("Chien", "Solo"))) \
+        .correlate(md.Donne) \
+        .exists()
+    cases = []
+    for table_ in (3, 4, 5):
+        for called, preneur_alone in ((alone, "Chien"), (None, "")):
+            preneur, appele, defense = distribution_point_between_attack_defense(1, preneur_alone, table_)
+            where = [md.Game.table_ == table_] + ([called] if called is not None else [])
+            cases.append((and_(*where, md.Participation.role == "preneur"), preneur))
+            cases.append((and_(*where, md.Participation.role == "appele"), appele or 0))
+        cases.append((and_(md.Game.table_ == table_, md.Participation.role == "defense"), defense))
+    return case(*cases, else_=0)
+
+
+def select_points_sql(start_date: datetime, end_date: datetime, nombre_joueurs: int | None) -> Select:
+    """Retourne la requête des points de chaque joueur pour chaque donne jouée dans une période
+    donnée et pour un nombre de joueurs (tous si None), calculés entièrement par SQLite"""
+    points = (donne_result_expression() * role_coefficient_expression()).label("points")
+    return select(md.Game.id_game, md.Donne.id_donne, md.Participation.player_id, points) \
+        .select_from(md.Participation) \
+        .join(md.Donne, md.Participation.donne_id == md.Donne.id_donne) \
         .join(md.Game, md.Donne.game_id == md.Game.id_game) \
-        .where(and_(between(md.Game.date_, start_date, end_date)),
-               md.Game.table_ == nombre_joueurs)
-    return pd.read_sql_query(sql=query, con=md.engine, index_col="id_donne")
+        .where(game_filter(start_date, end_date, nombre_joueurs))
 
 
-def get_appele(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> pd.DataFrame:
-    """Retourne un DataFrame de tous les joueurs ayant le rôle d'appelé parmis les donnes jouées
-    dans une période donnée avec un certain nombre de joueurs"""
-    query = select(md.Donne.id_donne, md.Player.nickname).select_from(md.Player) \
-        .join(md.Appele, md.Player.id_player == md.Appele.player_id) \
-        .join(md.Donne, md.Appele.donne_id == md.Donne.id_donne) \
-        .join(md.Game, md.Donne.game_id == md.Game.id_game) \
-        .where(and_(between(md.Game.date_, start_date, end_date)),
-               md.Game.table_ == nombre_joueurs)
-    return pd.read_sql_query(sql=query, con=md.engine, index_col="id_donne")
+def get_points_per_game_sql(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> dict[str, tuple]:
+    """Retourne, colonne par colonne (id_game, player_id, points), la somme des points de chaque
+    joueur pour chaque partie jouée dans une période donnée et pour un nombre de joueurs,
+    calculée par SQLite à partir des donnes"""
+    points = select_points_sql(start_date, end_date, nombre_joueurs).subquery()
+    query = select(points.c.id_game, points.c.player_id, func.sum(points.c.points).label("points")) \
+        .group_by(points.c.id_game, points.c.player_id)
+    return result_columns(md.read_session.execute(query))
 
 
-def get_defense(start_date: datetime, end_date: datetime, nombre_joueurs: int, num: int) -> pd.DataFrame:
-    """Retourne un DataFrame de tous les joueurs ayant le rôle de défenseur parmis les donnes jouées
-    dans une période donnée avec un certain nombre de joueurs"""
-    query = select(md.Donne.id_donne, md.Player.nickname).select_from(md.Player) \
-        .join(md.Defense, md.Player.id_player == md.Defense.player_id) \
-        .join(md.Donne, md.Defense.donne_id == md.Donne.id_donne) \
-        .join(md.Game, md.Donne.game_id == md.Game.id_game) \
-        .where(and_(between(md.Game.date_, start_date, end_date)),
-               md.Game.table_ == nombre_joueurs,
-               md.Defense.number == num)
-    return pd.read_sql_query(sql=query, con=md.engine, index_col="id_donne")
+def get_points_per_player_sql(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> list[tuple[str, int]]:
+    """Retourne les couples (pseudo, points) du total de chaque joueur sur une période et pour
+    un nombre de joueurs, calculé par SQLite à partir des donnes (hors Chien et Solo)"""
+    points = select_points_sql(start_date, end_date, nombre_joueurs).subquery()
+    query = select(md.Player.nickname, func.sum(points.c.points)) \
+        .join(points, points.c.player_id == md.Player.id_player) \
+        .where(md.Player.protect.is_(False)) \
+        .group_by(md.Player.id_player)
+    return [(nickname, total) for nickname, total in md.read_session.execute(query)]
 
 
-def get_pnj(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> pd.DataFrame:
-    """Retourne un DataFrame de tous les joueurs ayant le rôle de pnj parmis les donnes jouées
-    dans une période donnée avec un certain nombre de joueurs"""
-    query = select(md.Donne.id_donne, md.Player.nickname).select_from(md.Player) \
-        .join(md.Pnj, md.Player.id_player == md.Pnj.player_id) \
-        .join(md.Donne, md.Pnj.donne_id == md.Donne.id_donne) \
-        .join(md.Game, md.Donne.game_id == md.Game.id_game) \
-        .where(and_(between(md.Game.date_, start_date, end_date)),
-               md.Game.table_ == nombre_joueurs)
-    return pd.read_sql_query(sql=query, con=md.engine, index_col="id_donne")
+def get_distinct_player(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> list[str]:
+    """Retourne la liste de tous les joueurs ayant joué au moins une donne,
+    dans l'ordre de leur première participation"""
+    return [nickname for _, nickname in get_distinct_player_id(start_date, end_date, nombre_joueurs)]
 
 
-def get_distinct_player(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> list[str]:
-    """Retourne la liste de tous les joueurs ayant joué au moins une donne"""
-    query = select(md.Player.nickname).distinct().select_from(md.Player) \
+def get_distinct_player_id(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> list[tuple[int, str]]:
+    """Retourne la liste des couples (id, pseudo) de tous les joueurs ayant joué au moins une donne,
+    dans l'ordre de leur première participation"""
+    query = select(md.Player.id_player, md.Player.nickname).select_from(md.Player) \
         .join(md.GamePlayer, md.Player.id_player == md.GamePlayer.player_id) \
         .join(md.Game, md.GamePlayer.game_id == md.Game.id_game) \
         .where(and_(between(md.Game.date_, start_date, end_date)),
-               md.Game.table_ == nombre_joueurs)
-    return md.engine.execute(query).scalars().all()
+               md.Game.table_ == nombre_joueurs) \
+        .group_by(md.Player.id_player) \
+        .order_by(func.min(md.GamePlayer.id_game_player))
+    return [(player_id, nickname) for player_id, nickname in md.read_session.execute(query)]
+
+
+def get_game_players_id(start_date: datetime, end_date: datetime,
+                        nombre_joueurs: int | None) -> list[tuple[datetime.datetime, int, int, str]]:
+    """Retourne les quadruplets (date de la partie, nombre de joueurs de la table, id joueur, pseudo)
+    des joueurs ayant participé aux parties jouées dans une période donnée et pour un nombre de
+    joueurs (tous si None), dans l'ordre des parties"""
+    query = select(md.Game.date_, md.Game.table_, md.Player.id_player, md.Player.nickname) \
+        .select_from(md.GamePlayer) \
+        .join(md.Player, md.Player.id_player == md.GamePlayer.player_id) \
+        .join(md.Game, md.GamePlayer.game_id == md.Game.id_game) \
+        .where(game_filter(start_date, end_date, nombre_joueurs)) \
+        .order_by(md.Game.date_, md.GamePlayer.id_game_player)
+    return [(date_, table_, player_id, nickname)
+            for date_, table_, player_id, nickname in md.read_session.execute(query)]
+
+
+def insert_points_donne(points: list[dict]):
+    """Enregistre dans le registre des points, en une seule requête, les points marqués par
+    chaque joueur lors de chaque donne. Dictionnaires du type :
+    {'donne_id': int, 'player_id': int, 'points': int}. A appeler dans game_data_transaction."""
+    if points:
+        md.session.execute(insert(md.PointDonne), points)
+
+
+def ledger_is_missing() -> bool:
+    """Indique si des donnes sont enregistrées alors que le registre des points est vide
+    (parties enregistrées avant la création du registre)"""
+    with md.get_engine().connect() as connection:
+        has_donne = connection.execute(select(md.Donne.id_donne).limit(1)).first() is not None
+        return has_donne and connection.execute(select(md.PointDonne.id_point_donne).limit(1)).first() is None
+
+
+def delete_points_donne():
+    """Vide le registre des points. A appeler dans game_data_transaction."""
+    md.session.execute(delete(md.PointDonne))
+
+
+def get_points_per_game(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> dict[str, tuple]:
+    """Retourne, colonne par colonne (id_game, player_id, points), la somme des points de chaque
+    joueur pour chaque partie jouée dans une période donnée et pour un nombre de joueurs, d'après
+    le registre des points"""
+    query = select(md.Game.id_game, md.PointDonne.player_id, func.sum(md.PointDonne.points).label("points")) \
+        .select_from(md.PointDonne) \
+        .join(md.Donne, md.PointDonne.donne_id == md.Donne.id_donne) \
+        .join(md.Game, md.Donne.game_id == md.Game.id_game) \
+        .where(game_filter(start_date, end_date, nombre_joueurs)) \
+        .group_by(md.Game.id_game, md.PointDonne.player_id)
+    return result_columns(md.read_session.execute(query))
+
+
+def get_points_per_game_player(game_id: int | None = None) -> list[tuple[int, int, datetime, int, int]]:
+    """Retourne les quintuplets (id partie, nombre de joueurs, date, id joueur, points) de la somme
+    des points de chaque joueur d'une partie (toutes si None) d'après le registre des points,
+    dans l'ordre chronologique des parties"""
+    query = select(md.Game.id_game, md.Game.table_, md.Game.date_, md.PointDonne.player_id,
+                   func.sum(md.PointDonne.points)) \
+        .select_from(md.PointDonne) \
+        .join(md.Donne, md.PointDonne.donne_id == md.Donne.id_donne) \
+        .join(md.Game, md.Donne.game_id == md.Game.id_game) \
+        .group_by(md.Game.id_game, md.PointDonne.player_id) \
+        .order_by(md.Game.date_, md.Game.id_game, md.PointDonne.player_id)
+    if game_id is not None:
+        query = query.where(md.Game.id_game == game_id)
+    return [tuple(row) for row in md.session.execute(query)]
+
+
+def select_last_total(player_id, nombre_joueurs, date_, strict: bool = False):
+    """Retourne la sous-requête du dernier total cumulé d'un joueur, pour un nombre de joueurs,
+    à une date (avant cette date si strict), 0 s'il n'a pas encore joué"""
+    on_date = md.PointSnapshot.date_ < date_ if strict else md.PointSnapshot.date_ <= date_
+    last = select(md.PointSnapshot.total) \
+        .where(md.PointSnapshot.table_ == nombre_joueurs,
+               md.PointSnapshot.player_id == player_id,
+               on_date) \
+        .order_by(md.PointSnapshot.date_.desc(), md.PointSnapshot.game_id.desc()) \
+        .limit(1) \
+        .scalar_subquery()
+    return func.coalesce(last, 0)
+
+
+def insert_game_snapshot(game_id: int):
+    """Enregistre le total cumulé de chaque joueur à l'issue d'une partie, en ajoutant ses points
+    de la partie à son dernier total. La partie doit être la plus récente de sa table.
+    A appeler dans game_data_transaction."""
+    snapshots = [{"game_id": game_id, "player_id": player_id, "table_": table_, "date_": date_,
+                  "total": md.session.execute(select(select_last_total(player_id, table_, date_, True))).scalar()
+                  + points}
+                 for _, table_, date_, player_id, points in get_points_per_game_player(game_id)]
+    insert_point_snapshots(snapshots)
+
+
+def insert_point_snapshots(snapshots: list[dict]):
+    """Enregistre en une seule requête des totaux cumulés. Dictionnaires du type :
+    {'game_id': int, 'player_id': int, 'table_': int, 'date_': datetime, 'total': int}.
+    A appeler dans game_data_transaction."""
+    if snapshots:
+        md.session.execute(insert(md.PointSnapshot), snapshots)
+
+
+def delete_point_snapshots():
+    """Vide la table des totaux cumulés. A appeler dans game_data_transaction."""
+    md.session.execute(delete(md.PointSnapshot))
+
+
+def get_snapshot_standings(start_date: datetime, end_date: datetime, nombre_joueurs: int) -> list[tuple[str, int]]:
+    """Retourne les couples (pseudo, points) des joueurs ayant joué dans une période donnée et pour
+    un nombre de joueurs : différence entre leur total cumulé à la fin de la période et celui
+    d'avant son début. Une recherche dans l'index par joueur, quelle que soit la durée couverte."""
+    played = select(md.PointSnapshot.id_point_snapshot) \
+        .where(md.PointSnapshot.table_ == nombre_joueurs,
+               md.PointSnapshot.player_id == md.Player.id_player,
+               between(md.PointSnapshot.date_, start_date, end_date)) \
+        .exists()
+    query = select(md.Player.nickname,
+                   select_last_total(md.Player.id_player, nombre_joueurs, end_date)
+                   - select_last_total(md.Player.id_player, nombre_joueurs, start_date, True)) \
+        .where(played)
+    return [(nickname, points) for nickname, points in md.read_session.execute(query)]
+
+
+def get_points_per_month(game_id: int | None = None) -> list[dict]:
+    """Retourne, d'après le registre des points, le cumul par mois, nombre de joueurs et joueur
+    des points marqués, donnes et parties jouées lors d'une partie (toutes si None). Les donnes
+    où le joueur était pnj, présentes dans le registre avec 0 point, ne sont pas comptées."""
+    year = cast(func.strftime('%Y', md.Game.date_), Integer)
+    month = cast(func.strftime('%m', md.Game.date_), Integer)
+    query = select(year.label("year"), month.label("month"), md.Game.table_, md.PointDonne.player_id,
+                   func.sum(md.PointDonne.points).label("points"),
+                   func.count(case((md.Participation.role != "pnj", md.PointDonne.donne_id)).distinct())
+                   .label("donnes"),
+                   func.count(md.Game.id_game.distinct()).label("games")) \
+        .select_from(md.PointDonne) \
+        .join(md.Participation, and_(md.Participation.donne_id == md.PointDonne.donne_id,
+                                     md.Participation.player_id == md.PointDonne.player_id)) \
+        .join(md.Donne, md.PointDonne.donne_id == md.Donne.id_donne) \
+        .join(md.Game, md.Donne.game_id == md.Game.id_game) \
+        .group_by(year, month, md.Game.table_, md.PointDonne.player_id)
+    if game_id is not None:
+        query = query.where(md.Game.id_game == game_id)
+    return [dict(row) for row in md.session.execute(query).mappings()]
+
+
+def add_point_rollups(rollups: list[dict]):
+    """Ajoute des cumuls mensuels à ceux déjà enregistrés (ou les crée). Dictionnaires du type :
+    {'year': int, 'month': int, 'table_': int, 'player_id': int, 'points': int, 'donnes': int, 'games': int}.
+    A appeler dans game_data_transaction."""
+    if rollups:
+        query = sqlite_insert(md.PointRollup)
+        query = query.on_conflict_do_update(
+            index_elements=["table_", "player_id", "year", "month"],
+            set_={column: getattr(md.PointRollup, column) + getattr(query.excluded, column)
+                  for column in ("points", "donnes", "games")})
+        md.session.execute(query, rollups)
+
+
+def delete_point_rollups():
+    """Vide la table des cumuls mensuels. A appeler dans game_data_transaction."""
+    md.session.execute(delete(md.PointRollup))
+
+
+def get_rollup_totals(first_month: tuple[int, int], last_month: tuple[int, int],
+                      nombre_joueurs: int) -> list[tuple[str, int, int, int]]:
+    """Retourne les quadruplets (pseudo, points, donnes, parties) des joueurs ayant joué entre deux
+    mois (année, mois) inclus pour un nombre de joueurs, d'après les cumuls mensuels"""
+    month_index = md.PointRollup.year * 12 + md.PointRollup.month
+    query = select(md.Player.nickname, func.sum(md.PointRollup.points), func.sum(md.PointRollup.donnes),
+                   func.sum(md.PointRollup.games)) \
+        .select_from(md.PointRollup) \
+        .join(md.Player, md.PointRollup.player_id == md.Player.id_player) \
+        .where(md.PointRollup.table_ == nombre_joueurs,
+               between(month_index, first_month[0] * 12 + first_month[1], last_month[0] * 12 + last_month[1])) \
+        .group_by(md.Player.id_player)
+    return [(nickname, points, donnes, games) for nickname, points, donnes, games in md.read_session.execute(query)]
+
+
+def get_data_version() -> str:
+    """Retourne une empreinte des données de parties (nombre de lignes et id maximal de chaque
+    table de parties, donnes et rôles). Elle change dès qu'une partie est enregistrée ou supprimée,
+    y compris par une autre instance de l'application."""
+    columns = []
+    for table in (md.Game, md.GamePlayer, md.Donne, md.Participation):
+        primary_key = table.__table__.primary_key.columns[0]
+        columns.append(select(func.count(primary_key)).scalar_subquery())
+        columns.append(select(func.max(primary_key)).scalar_subquery())
+    values = md.read_session.execute(select(*columns)).one()
+    return "-".join(str(value or 0) for value in values)
+
+
+def get_stored_ranking(start_date: datetime, end_date: datetime, nombre_joueurs: int,
+                       scoring_version: int, data_version: str) -> dict[str, list[int]] | None:
+    """Retourne le classement stocké pour une période, un nombre de joueurs et les versions
+    des règles de calcul et des données. Retourne None s'il n'a pas encore été calculé."""
+    statement = select(md.RankingCache.ranking).where(and_(md.RankingCache.start_date == start_date,
+                                                           md.RankingCache.end_date == end_date,
+                                                           md.RankingCache.table_ == nombre_joueurs,
+                                                           md.RankingCache.scoring_version == scoring_version,
+                                                           md.RankingCache.data_version == data_version))
+    return md.read_session.execute(statement).scalar()
+
+
+def insert_stored_ranking(start_date: datetime, end_date: datetime, nombre_joueurs: int,
+                          scoring_version: int, data_version: str, ranking: dict[str, list[int]]):
+    """Stocke le classement calculé pour une période et un nombre de joueurs, après avoir
+    supprimé les classements calculés avec d'autres versions des règles ou des données"""
+    with write_lock:
+        md.session.execute(delete(md.RankingCache).where(or_(md.RankingCache.scoring_version != scoring_version,
+                                                             md.RankingCache.data_version != data_version)))
+        md.session.add(md.RankingCache(start_date=start_date,
+                                       end_date=end_date,
+                                       table_=nombre_joueurs,
+                                       scoring_version=scoring_version,
+                                       data_version=data_version,
+                                       ranking=ranking))
+        md.session.commit()
 
 
 def get_hash_and_salt() -> tuple[str, str]:
@@ -0,0 +1,115 @@
+"""Migrations du schéma des bdd existantes. La version du schéma est stockée dans
+PRAGMA user_version : au lancement, les migrations de numéro supérieur sont appliquées dans
+l'ordre, chacune dans sa transaction avec la mise à jour de la version. Une bdd créée par
+init_bdd l'est directement à la dernière version. Une migration ne doit jamais être modifiée
+une fois publiée ; toute évolution du schéma s'ajoute en fin de liste. Les tables absentes
+sont créées auparavant par create_missing_tables : une migration peut donc alimenter une
+table nouvellement déclarée dans models.py. Le registre des points est ensuite construit
+s'il est vide alors que des parties sont enregistrées (bdd antérieure au registre)."""
+
+import suivi_tarot.database.models as md
+from suivi_tarot.database.clients import create_missing_tables, ledger_is_missing
+
+
+# Chaque migration : (description, instructions SQL). Sa version est sa position + 1.
+MIGRATIONS: list[tuple[str, list[str]]] = [
+    ("Index des filtres de parties par nombre de joueurs et date",
+     ["CREATE INDEX IF NOT EXISTS ix_game_table_date ON game (table_, date_)",
+      "CREATE INDEX IF NOT EXISTS ix_game_player_game ON game_player (game_id, player_id)",
+      "CREATE INDEX IF NOT EXISTS ix_game_player_player ON game_player (player_id, game_id)",
+      "CREATE INDEX IF NOT EXISTS ix_donne_game ON donne (game_id)"]),
+    ("Index des jointures des rôles",
+     ["CREATE INDEX IF NOT EXISTS ix_preneur_player ON preneur (player_id, donne_id)",
+      "CREATE INDEX IF NOT EXISTS ix_appele_player ON appele (player_id, donne_id)",
+      "CREATE INDEX IF NOT EXISTS ix_defense_donne_number ON defense (donne_id, number)",
+      "CREATE INDEX IF NOT EXISTS ix_defense_player ON defense (player_id, donne_id)",
+      "CREATE INDEX IF NOT EXISTS ix_pnj_player ON pnj (player_id, donne_id)",
+      "ANALYZE"]),
+    ("Regroupement des tables preneur, appele, pnj et defense dans la table participation",
+     ["INSERT INTO participation (donne_id, player_id, role, seat) "
+      "SELECT donne_id, player_id, 'preneur', 0 FROM preneur",
+      "INSERT INTO participation (donne_id, player_id, role, seat) "
+      "SELECT donne_id, player_id, 'appele', 0 FROM appele",
+      "INSERT INTO participation (donne_id, player_id, role, seat) "
+      "SELECT donne_id, player_id, 'pnj', 0 FROM pnj",
+      "INSERT INTO participation (donne_id, player_id, role, seat) "
+      "SELECT donne_id, player_id, 'defense', number FROM defense",
+      "DROP TABLE preneur",
+      "DROP TABLE appele",
+      "DROP TABLE pnj",
+      "DROP TABLE defense",
+      "ANALYZE"]),
+    ("Stockage du contrat, de la tête, du petit au bout, de la poignée et des chelems en codes entiers",
+     ["CREATE TABLE donne_encoded (id_donne INTEGER NOT NULL, game_id INTEGER NOT NULL, "
+      "nb_bout INTEGER NOT NULL, contract INTEGER NOT NULL, tete INTEGER NOT NULL, point FLOAT NOT NULL, "
+      "petit INTEGER NOT NULL, poignee INTEGER NOT NULL, petit_chelem INTEGER NOT NULL, "
+      "grand_chelem INTEGER NOT NULL, PRIMARY KEY (id_donne), FOREIGN KEY(game_id) REFERENCES game (id_game))",
+      "INSERT INTO donne_encoded SELECT id_donne, game_id, nb_bout, "
+      "CASE contract WHEN 'G' THEN 0 WHEN 'GS' THEN 1 WHEN 'GC' THEN 2 END, "
+      "CASE tete WHEN 'R ♥' THEN 1 WHEN 'R ♦' THEN 2 WHEN 'R ♣' THEN 3 WHEN 'R ♠' THEN 4 "
+      "WHEN 'D ♥' THEN 5 WHEN 'D ♦' THEN 6 WHEN 'D ♣' THEN 7 WHEN 'D ♠' THEN 8 ELSE 0 END, "
+      "point, "
+      "CASE WHEN petit = 'Gagné' THEN 1 WHEN petit IS NULL OR petit = '' THEN 0 ELSE 2 END, "
+      "CASE poignee WHEN 'No' THEN 1 WHEN 'Simple' THEN 2 WHEN 'Double' THEN 3 WHEN 'Triple' THEN 4 ELSE 0 END, "
+      "CASE WHEN petit_chelem IS NULL OR petit_chelem = '' THEN 0 ELSE 1 END, "
+      "CASE grand_chelem WHEN 'Réussi' THEN 1 WHEN 'Réussi ss annonce' THEN 2 WHEN 'Raté' THEN 3 ELSE 0 END "
+      "FROM donne",
+      "DROP TABLE donne",
+      "ALTER TABLE donne_encoded RENAME TO donne",
+      "CREATE INDEX ix_donne_game ON donne (game_id)",
+      "INSERT INTO donne_code (attribute, code, label) VALUES "
+      "('contract', 0, 'G'), ('contract', 1, 'GS'), ('contract', 2, 'GC'), "
+      "('poignee', 0, ''), ('poignee', 1, 'No'), ('poignee', 2, 'Simple'), ('poignee', 3, 'Double'), "
+      "('poignee', 4, 'Triple'), "
+      "('tete', 0, ''), ('tete', 1, 'R ♥'), ('tete', 2, 'R ♦'), ('tete', 3, 'R ♣'), ('tete', 4, 'R ♠'), "
+      "('tete', 5, 'D ♥'), ('tete', 6, 'D ♦'), ('tete', 7, 'D ♣'), ('tete', 8, 'D ♠'), "
+      "('petit', 0, ''), ('petit', 1, 'Gagné'), ('petit', 2, 'Perdu'), "
+      "('petit_chelem', 0, ''), ('petit_chelem', 1, 'Oui'), "
+      "('grand_chelem', 0, ''), ('grand_chelem', 1, 'Réussi'), ('grand_chelem', 2, 'Réussi ss annonce'), "
+      "('grand_chelem', 3, 'Raté')",
+      "ANALYZE"]),
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_schema_version() -> int:
+    """Retourne la version du schéma de la bdd"""
+    with md.get_engine().connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def set_schema_version(version: int):
+    """Enregistre la version du schéma de la bdd"""
+    with md.get_engine().begin() as connection:
+        connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+
+
+def migrate() -> list[str]:
+    """Met à jour le schéma de la bdd vers la dernière version.
+    Retourne la description des migrations appliquées"""
+    create_missing_tables()
+    applied = []
+    for version in range(get_schema_version() + 1, SCHEMA_VERSION + 1):
+        description, statements = MIGRATIONS[version - 1]
+        with md.get_engine().begin() as connection:
+            for statement in statements:
+                connection.exec_driver_sql(statement)
+            connection.exec_driver_sql(f"PRAGMA user_version = {version}")
+        applied.append(description)
+    if ledger_is_missing():
+        from suivi_tarot.api.ledger import rebuild_ledger
+
+        rebuild_ledger()
+        applied.append("Construction du registre des points des parties existantes")
+    if applied:
+        # Récupère la place libérée par les tables reconstruites ou supprimées
+        with md.get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.exec_driver_sql("VACUUM")
+    return applied
+
+
+if __name__ == '__main__':
+    for migration in migrate():
+        print(f"Migration appliquée : {migration}")
+    print(f"Version du schéma : {get_schema_version()}")
@@ -1,29 +1,130 @@
 """Représentation sous forme de classes via SQLAlchemy de la bdd"""
 
-from sqlalchemy import create_engine, Integer, Column, String, Boolean, ForeignKey, DateTime, Enum, Float
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from pathlib import Path
+
+from sqlalchemy import create_engine, event, Engine, Integer, Column, String, Boolean, ForeignKey, DateTime, Float, \
+    JSON, UniqueConstraint, Index
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, scoped_session, Session as OrmSession
 
-from suivi_tarot.api.calcul import Contract, Poignee
 from suivi_tarot.api.utils import SETTINGS_FILE, DATA_FILE
-from suivi_tarot.api.settings import get_path_database
+from suivi_tarot.api.settings import get_path_database, get_sqlite_profile
 
 
 echo = False
-# Connexion à la base de données
-if SETTINGS_FILE.exists():
-    # Vérification de l'existance d'une bdd valide
-    path, valid = get_path_database(".sqlite3")
-    if valid:
-        engine = create_engine(f'sqlite:///{path}', echo=echo)
-    else:
-        # Sinon, tente une connexion au niveau du projet
-        engine = create_engine(f'sqlite:///{DATA_FILE}', echo=echo)
-else:
-    # Sinon, tente une connexion au niveau du projet
-    engine = create_engine(f'sqlite:///{DATA_FILE}', echo=echo)
 
-Session = sessionmaker(bind=engine)
-session = Session()
+# Pragmas pris en charge par le profil de connexion, dans leur ordre d'application
+SQLITE_PRAGMAS = ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store")
+# Pragmas modifiant le fichier, appliqués uniquement par le moteur d'écriture
+SQLITE_WRITE_PRAGMAS = ("journal_mode", "synchronous")
+
+# Créés au premier accès à la bdd (get_engine) ou par configure, aucun fichier n'est lu à l'import
+database: Path | None = None
+engine: Engine | None = None
+# Moteur de lecture pour les calculs (classements, statistiques) : petit pool de connexions
+# en lecture seule, utilisables en parallèle des écritures grâce au journal WAL
+read_engine: Engine | None = None
+sqlite_profile: dict = {}
+
+
+def get_database_path() -> Path:
+    """Retourne le chemin de la bdd stocké dans settings.json s'il est valide,
+    sinon celui de la bdd au niveau du projet"""
+    if SETTINGS_FILE.exists():
+        # Vérification de l'existance d'une bdd valide
+        path, valid = get_path_database(".sqlite3")
+        if valid:
+            return path
+    # Sinon, tente une connexion au niveau du projet
+    return DATA_FILE
+
+
+def configure(path: Path | str | None = None):
+    """Connecte l'application à une bdd (par défaut celle de settings.json) : crée le moteur
+    d'écriture, un seul thread écrivant à la fois (verrou write_lock de clients.py),
+    et le moteur de lecture. Ferme au préalable les connexions à la bdd précédente."""
+    global database, engine, read_engine, sqlite_profile
+    dispose()
+    database = Path(path) if path else get_database_path()
+    sqlite_profile = get_sqlite_profile()
+    engine = create_engine(f'sqlite:///{database}', echo=echo, connect_args={"check_same_thread": False})
+    read_engine = create_engine(f'sqlite:///{database}', echo=echo, pool_size=4, max_overflow=0,
+                                connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", apply_sqlite_profile)
+    event.listen(read_engine, "connect", apply_read_only_profile)
+
+
+def dispose():
+    """Ferme les sessions du thread courant et les connexions à la bdd, qui sera de nouveau
+    ouverte au prochain accès. La correspondance pseudo <-> id des joueurs est oubliée."""
+    global engine, read_engine
+    from suivi_tarot.database.clients import clear_player_ids
+
+    session.remove()
+    read_session.remove()
+    for connected_engine in (engine, read_engine):
+        if connected_engine is not None:
+            connected_engine.dispose()
+    engine, read_engine = None, None
+    clear_player_ids()
+
+
+def get_engine() -> Engine:
+    """Retourne le moteur d'écriture, en se connectant à la bdd au premier appel"""
+    if engine is None:
+        configure()
+    return engine
+
+
+def get_read_engine() -> Engine:
+    """Retourne le moteur de lecture, en se connectant à la bdd au premier appel"""
+    if read_engine is None:
+        configure()
+    return read_engine
+
+
+def apply_sqlite_profile(dbapi_connection, connection_record):
+    """Applique le profil de connexion (settings.json) à chaque nouvelle connexion SQLite"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        if pragma in sqlite_profile:
+            cursor.execute(f"PRAGMA {pragma} = {sqlite_profile[pragma]}")
+    cursor.close()
+
+
+def apply_read_only_profile(dbapi_connection, connection_record):
+    """Applique le profil de connexion à chaque nouvelle connexion de lecture,
+    interdite en écriture par query_only"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        if pragma in sqlite_profile and pragma not in SQLITE_WRITE_PRAGMAS:
+            cursor.execute(f"PRAGMA {pragma} = {sqlite_profile[pragma]}")
+    cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+def get_sqlite_pragmas(bind: Engine | None = None) -> dict:
+    """Retourne la valeur effective des pragmas du profil de connexion sur une connexion
+    d'un moteur (par défaut celui d'écriture)"""
+    with (bind or get_engine()).connect() as connection:
+        return {pragma: connection.exec_driver_sql(f"PRAGMA {pragma}").scalar() for pragma in SQLITE_PRAGMAS}
+
+
+def new_session() -> OrmSession:
+    """Retourne une session liée au moteur d'écriture"""
+    return Session(bind=get_engine())
+
+
+def new_read_session() -> OrmSession:
+    """Retourne une session liée au moteur de lecture"""
+    return ReadSession(bind=get_read_engine())
+
+
+# Une session par thread, créée au premier accès : session pour l'application et les écritures,
+# read_session pour les lectures des calculs
+Session = sessionmaker()
+session = scoped_session(new_session)
+ReadSession = sessionmaker()
+read_session = scoped_session(new_read_session)
 Base = declarative_base()
 
 
@@ -40,10 +141,7 @@ class Player(Base):
     protect = Column(Boolean, nullable=False)
 
     game_player = relationship('GamePlayer', back_populates='player')
-    preneur = relationship('Preneur', back_populates='player')
-    appele = relationship('Appele', back_populates='player')
-    defense = relationship('Defense', back_populates='player')
-    pnj = relationship('Pnj', back_populates='player')
+    participation = relationship('Participation', back_populates='player')
 
     def __repr__(self):
         return f"Player(id: {self.id}, nickname: {self.pseudo}, nom: {self.nom}, prenom: {self.prenom}, " \
@@ -53,6 +151,7 @@ class Player(Base):
 class Game(Base):
     """Représente une partie avec sa date et le nombre de joueurs présents."""
     __tablename__ = 'game'
+    __table_args__ = (Index('ix_game_table_date', 'table_', 'date_'),)
 
     id_game = Column(Integer, primary_key=True, autoincrement=True)
     date_ = Column(DateTime, unique=True, nullable=False)
@@ -68,6 +167,8 @@ class Game(Base):
 class GamePlayer(Base):
     """Association d'une partie aux joueurs la disputant."""
     __tablename__ = 'game_player'
+    __table_args__ = (Index('ix_game_player_game', 'game_id', 'player_id'),
+                      Index('ix_game_player_player', 'player_id', 'game_id'))
 
     id_game_player = Column(Integer, primary_key=True, autoincrement=True)
     game_id = Column(Integer, ForeignKey('game.id_game'), nullable=False)
@@ -78,76 +179,95 @@ class GamePlayer(Base):
 
 
 class Donne(Base):
-    """Représente les donnes d'une partie."""
+    """Représente les donnes d'une partie. Le contrat, la tête, le petit au bout, la poignée et
+    les chelems sont stockés sous forme de codes entiers (DONNE_CODES, table donne_code)."""
     __tablename__ = 'donne'
+    __table_args__ = (Index('ix_donne_game', 'game_id'),)
 
     id_donne = Column(Integer, primary_key=True, autoincrement=True)
     game_id = Column(Integer, ForeignKey('game.id_game'), nullable=False)
     nb_bout = Column(Integer, nullable=False)
-    contract = Column(Enum(Contract), nullable=False)
-    tete = Column(String)
+    contract = Column(Integer, nullable=False)
+    tete = Column(Integer, nullable=False)
     point = Column(Float, nullable=False)
-    petit = Column(String)
-    poignee = Column(Enum(Poignee))
-    petit_chelem = Column(String)
-    grand_chelem = Column(String)
+    petit = Column(Integer, nullable=False)
+    poignee = Column(Integer, nullable=False)
+    petit_chelem = Column(Integer, nullable=False)
+    grand_chelem = Column(Integer, nullable=False)
 
     game = relationship('Game', back_populates='donne')
-    preneur = relationship('Preneur', back_populates='donne')
-    appele = relationship('Appele', back_populates='donne')
-    defense = relationship('Defense', back_populates='donne')
-    pnj = relationship('Pnj', back_populates='donne')
+    participation = relationship('Participation', back_populates='donne')
 
 
-class Preneur(Base):
-    """Représente le joueur ayant fait la plus grande enchère (contrat) d'une donne."""
-    __tablename__ = 'preneur'
-
-    id_preneur = Column(Integer, primary_key=True, autoincrement=True)
-    donne_id = Column(Integer, ForeignKey('donne.id_donne'), unique=True, nullable=False)
-    player_id = Column(Integer, ForeignKey('player.id_player'), nullable=False)
+class DonneCode(Base):
+    """Table de correspondance entre les codes stockés dans la table donne et leur libellé"""
+    __tablename__ = 'donne_code'
 
-    donne = relationship('Donne', back_populates='preneur')
-    player = relationship('Player', back_populates='preneur')
+    attribute = Column(String, primary_key=True)
+    code = Column(Integer, primary_key=True)
+    label = Column(String, nullable=False)
 
 
-class Appele(Base):
-    """Représente le joueur ayant été appelé par le preneur lors d'une donne.
-    Seulement pour les parties à 5 ou 6 joueurs"""
-    __tablename__ = 'appele'
+class Participation(Base):
+    """Représente un joueur tenant un rôle lors d'une donne : preneur, appele (parties à 5 ou 6
+    joueurs), pnj (parties à 6 joueurs) ou defense. seat numérote les défenseurs à partir de 1,
+    il vaut 0 pour les autres rôles."""
+    __tablename__ = 'participation'
+    __table_args__ = (UniqueConstraint('donne_id', 'role', 'seat'),
+                      Index('ix_participation_player', 'player_id', 'donne_id'))
 
-    id_appele = Column(Integer, primary_key=True, autoincrement=True)
-    donne_id = Column(Integer, ForeignKey('donne.id_donne'), unique=True, nullable=False)
+    id_participation = Column(Integer, primary_key=True, autoincrement=True)
+    donne_id = Column(Integer, ForeignKey('donne.id_donne'), nullable=False)
     player_id = Column(Integer, ForeignKey('player.id_player'), nullable=False)
+    role = Column(String, nullable=False)
+    seat = Column(Integer, nullable=False)
 
-    donne = relationship('Donne', back_populates='appele')
-    player = relationship('Player', back_populates='appele')
+    donne = relationship('Donne', back_populates='participation')
+    player = relationship('Player', back_populates='participation')
 
 
-class Defense(Base):
-    """Représente les joueurs qui ne sont ni preneur, appele ou pnj d'une donne."""
-    __tablename__ = 'defense'
+class PointDonne(Base):
+    """Registre des points : points marqués par un joueur lors d'une donne, quel que soit son rôle
+    (0 pour le pnj). Alimenté à l'enregistrement de chaque partie."""
+    __tablename__ = 'point_donne'
+    __table_args__ = (UniqueConstraint('donne_id', 'player_id'),)
 
-    id_defense = Column(Integer, primary_key=True, autoincrement=True)
-    donne_id = Column(Integer, ForeignKey('donne.id_donne'), nullable=False)
-    player_id = Column(Integer, ForeignKey('player.id_player'), nullable=False)
-    number = Column(Integer, nullable=False)
+    id_point_donne = Column(Integer, primary_key=True, autoincrement=True)
+    donne_id = Column(Integer, ForeignKey('donne.id_donne'), nullable=False, index=True)
+    player_id = Column(Integer, ForeignKey('player.id_player'), nullable=False, index=True)
+    points = Column(Integer, nullable=False)
+
+
+class PointSnapshot(Base):
+    """Total cumulé d'un joueur, pour un nombre de joueurs, à l'issue de chaque partie qu'il a jouée.
+    La date et la table de la partie sont recopiées pour que l'index retrouve en une recherche
+    le dernier total d'un joueur à une date donnée."""
+    __tablename__ = 'point_snapshot'
+    __table_args__ = (UniqueConstraint('game_id', 'player_id'),
+                      Index('ix_point_snapshot_lookup', 'table_', 'player_id', 'date_', 'game_id'))
 
-    donne = relationship('Donne', back_populates='defense')
-    player = relationship('Player', back_populates='defense')
+    id_point_snapshot = Column(Integer, primary_key=True, autoincrement=True)
+    game_id = Column(Integer, ForeignKey('game.id_game'), nullable=False)
+    player_id = Column(Integer, ForeignKey('player.id_player'), nullable=False)
+    table_ = Column(Integer, nullable=False)
+    date_ = Column(DateTime, nullable=False)
+    total = Column(Integer, nullable=False)
 
 
-class Pnj(Base):
-    """Représente pour une donne le joueur ne l'ayant pas disputé.
-    Seulement pour les parties à 6 joueurs"""
-    __tablename__ = 'pnj'
+class PointRollup(Base):
+    """Cumul mensuel d'un joueur pour un nombre de joueurs : points marqués, donnes et parties jouées"""
+    __tablename__ = 'point_rollup'
+    __table_args__ = (UniqueConstraint('table_', 'player_id', 'year', 'month'),)
 
-    id_pnj = Column(Integer, primary_key=True, autoincrement=True)
-    donne_id = Column(Integer, ForeignKey('donne.id_donne'), unique=True, nullable=False)
+    id_point_rollup = Column(Integer, primary_key=True, autoincrement=True)
+    year = Column(Integer, nullable=False)
+    month = Column(Integer, nullable=False)
+    table_ = Column(Integer, nullable=False)
     player_id = Column(Integer, ForeignKey('player.id_player'), nullable=False)
+    points = Column(Integer, nullable=False)
+    donnes = Column(Integer, nullable=False)
+    games = Column(Integer, nullable=False)
 
-    donne = relationship('Donne', back_populates='pnj')
-    player = relationship('Player', back_populates='pnj')
 
 class Password(Base):
     """Table servant à stocker le hash du mot de passe défini à la création de la
@@ -157,3 +277,26 @@ class Password(Base):
     id_password = Column(Integer, primary_key=True, autoincrement=True)
     hash_ = Column(String, nullable=False)
     salt = Column(String, nullable=False)
+
+
+class RankingCache(Base):
+    """Classement déjà calculé pour une période et un nombre de joueurs, stocké sous la forme
+    {pseudo: [score cumulé après chaque partie]}. Une entrée n'est valable que pour la version
+    des règles de calcul et l'empreinte des données de parties avec lesquelles elle a été calculée."""
+    __tablename__ = 'ranking_cache'
+    __table_args__ = (UniqueConstraint('start_date', 'end_date', 'table_', 'scoring_version', 'data_version'),)
+
+    id_ranking_cache = Column(Integer, primary_key=True, autoincrement=True)
+    start_date = Column(DateTime, nullable=False)
+    end_date = Column(DateTime, nullable=False)
+    table_ = Column(Integer, nullable=False)
+    scoring_version = Column(Integer, nullable=False)
+    data_version = Column(String, nullable=False)
+    ranking = Column(JSON, nullable=False)
+
+
+if __name__ == '__main__':
+    # Vérification du profil de connexion : python -m suivi_tarot.database.models
+    print(f"Bdd : {get_database_path()}")
+    print(f"Moteur d'écriture : {get_sqlite_pragmas(get_engine())}")
+    print(f"Moteur de lecture : {get_sqlite_pragmas(get_read_engine())}")
@@ -0,0 +1,37 @@
+"""Boucle asyncio intégrée à la boucle d'évènements de Qt (QtAsyncio) : les coroutines lancées
+par les fenêtres s'exécutent dans le thread de l'interface, entre deux évènements Qt."""
+
+import asyncio
+from typing import Coroutine
+
+from PySide6.QtAsyncio import QAsyncioEventLoopPolicy
+from PySide6.QtWidgets import QApplication
+
+# Code de sortie de l'application, donné à exit_event_loop et retourné par run_event_loop
+exit_code = 0
+
+
+def install_event_loop(application: QApplication):
+    """Remplace la boucle asyncio par celle de Qt. A appeler avant la création des fenêtres."""
+    asyncio.set_event_loop_policy(QAsyncioEventLoopPolicy(application))
+
+
+def run_event_loop() -> int:
+    """Lance la boucle d'évènements de Qt, qui exécute aussi les coroutines, jusqu'à la fermeture
+    de l'application, et retourne son code de sortie (0 sauf arrêt par exit_event_loop)"""
+    asyncio.get_event_loop().run_forever()
+    return exit_code
+
+
+def exit_event_loop(code: int):
+    """Arrête la boucle d'évènements avec un code de sortie, que run_forever de QtAsyncio
+    ne retourne pas : il est conservé pour être retourné par run_event_loop"""
+    global exit_code
+    exit_code = code
+    QApplication.exit(code)
+
+
+def start_task(coroutine: Coroutine) -> asyncio.Task:
+    """Lance une coroutine sur la boucle de Qt, depuis le thread de l'interface. Si la boucle
+    n'est pas encore lancée, la coroutine démarre à son lancement."""
+    return asyncio.ensure_future(coroutine)
@@ -1,11 +1,13 @@
 from PySide6.QtCore import Qt, QSize
-from PySide6.QtWidgets import QWidget, QGroupBox, QPushButton, QHBoxLayout, QVBoxLayout
+from PySide6.QtGui import QCloseEvent
+from PySide6.QtWidgets import QWidget, QGroupBox, QPushButton, QHBoxLayout, QVBoxLayout, QMessageBox
 
 from suivi_tarot.window.color_player import ColorPlayerWindow
-from suivi_tarot.window.ranking import RankingWindow
-from suivi_tarot.window.select_joueur import SelectPlayerWindow
-from suivi_tarot.window.manage_player import ManagementPlayerWindow
-from suivi_tarot.window.table import LabelScore
+from suivi_tarot.window.event_loop import exit_event_loop
+from suivi_tarot.window.save_queue import SaveQueue
+
+# Les fenêtres des autres fonctionnalités sont importées à leur première ouverture : elles
+# chargent SQLAlchemy, NumPy, pandas ou matplotlib, inutiles à l'affichage de la fenêtre principale
 
 
 class CustomButton(QPushButton):
@@ -22,6 +24,7 @@ class MainWindow(QWidget):
     def __init__(self):
         super().__init__()
 
+        self.save_queue = SaveQueue(self)
         self.setup_ui()
 
     def setup_ui(self):
@@ -65,23 +68,49 @@ class MainWindow(QWidget):
         self.btn_ranking.clicked.connect(self.display_ranking)
         self.btn_player.clicked.connect(self.management_player)
         self.btn_color.clicked.connect(self.management_color)
+        self.save_queue.signals.failed.connect(self.save_failed)
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        """Attend la fin de l'enregistrement des parties en cours avant de quitter"""
+        self.save_queue.wait()
+
+    def open_database(self):
+        """Met à jour le schéma de la bdd puis enregistre les parties restées en attente lors
+        d'un lancement précédent. Appelée une fois la fenêtre affichée : le chargement de SQLAlchemy
+        et les migrations ne retardent pas son affichage."""
+        from suivi_tarot.database.migrations import migrate
+
+        try:
+            migrate()
+        except Exception as error:
+            QMessageBox.critical(self, "Connexion à la bdd", f"Mise à jour de la bdd impossible : {error}")
+            exit_event_loop(1)
+            return
+        self.save_queue.flush()
 
     def new_game(self):
         """Ouvre la fenêtre de sélection des joueurs pour l'enregistrement
         d'une nouvelle partie"""
+        from suivi_tarot.window.select_joueur import SelectPlayerWindow
+        from suivi_tarot.window.table import LabelScore
+
         LabelScore.number_label = 0
-        self.game = SelectPlayerWindow()
+        self.game = SelectPlayerWindow(self.save_queue)
         self.game.setWindowModality(Qt.ApplicationModal)
         self.game.show()
 
     def display_ranking(self):
         """Ouvre la fenêtre de visualisation du classement général"""
+        from suivi_tarot.window.ranking import RankingWindow
+
         self.ranking = RankingWindow()
         self.ranking.setWindowModality(Qt.ApplicationModal)
         self.ranking.show()
 
     def management_player(self):
         """Ouvre la fenêtre de gestion des joueurs"""
+        from suivi_tarot.window.manage_player import ManagementPlayerWindow
+
         self.manage_player = ManagementPlayerWindow(self)
         self.manage_player.show()
 
@@ -90,3 +119,7 @@ class MainWindow(QWidget):
         self.color = ColorPlayerWindow()
         self.color.setWindowModality(Qt.ApplicationModal)
         self.color.show()
+
+    def save_failed(self, message: str):
+        """Signale à l'utilisateur l'échec de l'enregistrement d'une partie"""
+        QMessageBox.warning(self, "Enregistrement de la partie", message)
@@ -1,11 +1,14 @@
 from datetime import datetime
+from functools import partial
 
-from PySide6.QtCore import Qt, Signal
-from PySide6.QtGui import QFont
+from PySide6.QtCore import Qt, Signal, QObject, QRunnable, QThreadPool
+from PySide6.QtGui import QFont, QCloseEvent
 from PySide6.QtWidgets import QApplication, QWidget, QPushButton, QHBoxLayout, QVBoxLayout, QGridLayout, QSpacerItem, \
     QSizePolicy, QLabel
 
-from suivi_tarot.api.ranking import Ranking
+from suivi_tarot.api.ranking_engine import create_ranking
+from suivi_tarot.database.clients import interruptible
+from suivi_tarot.window.event_loop import install_event_loop, run_event_loop
 from suivi_tarot.window.graph_ranking import GraphWidget
 from suivi_tarot.window.select_dates import SelectDates
 from suivi_tarot.window.table import LabelScore
@@ -19,6 +22,46 @@ def clear_layout(layout):
             child.widget().deleteLater()
 
 
+class RankingSignals(QObject):
+    """Signaux émis par RankingWorker, reçus dans le thread de l'interface"""
+    progress = Signal(str)
+    finished = Signal(object)
+    failed = Signal(str)
+
+
+class RankingWorker(QRunnable):
+    """Calcul d'un classement hors du thread de l'interface. state passe de "pending" à "running"
+    puis "done". Une fois annulé, les requêtes en cours sont interrompues et aucun résultat
+    n'est émis."""
+
+    def __init__(self, start: datetime, end: datetime, table_of: int):
+        super().__init__()
+
+        self.parameters = (start, end, table_of)
+        self.state = "pending"
+        self.cancelled = False
+        self.signals = RankingSignals()
+
+    def cancel(self):
+        """Annule le calcul, qu'il soit en attente ou en cours"""
+        self.cancelled = True
+
+    def run(self):
+        self.state = "running"
+        if not self.cancelled:
+            self.signals.progress.emit("Calcul du classement en cours...")
+            try:
+                with interruptible(lambda: self.cancelled):
+                    rank = create_ranking(*self.parameters)
+            except Exception as error:
+                if not self.cancelled:
+                    self.signals.failed.emit(f"Erreur lors du calcul du classement : {error}")
+            else:
+                if not self.cancelled:
+                    self.signals.finished.emit(rank)
+        self.state = "done"
+
+
 # noinspection PyAttributeOutsideInit
 class RankingWindow(QWidget):
 
@@ -27,6 +70,9 @@ class RankingWindow(QWidget):
     def __init__(self):
         super().__init__()
 
+        self.worker = None
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
         self.setup_ui()
         self.setWindowTitle("Classement")
         self.init_graph()
@@ -84,17 +130,40 @@ class RankingWindow(QWidget):
         self.search.search_parameters.connect(self.update_display)
         self.search.show()
 
+    def closeEvent(self, event: QCloseEvent) -> None:
+        """Annule le calcul de classement éventuellement en cours"""
+        self.cancel_worker()
+
+    def cancel_worker(self):
+        """Annule le calcul de classement précédent, en attente ou en cours"""
+        if self.worker is not None:
+            self.worker.cancel()
+            if self.worker.state == "pending":
+                self.thread_pool.tryTake(self.worker)
+            self.worker = None
+
     def update_display(self, start: datetime, end: datetime, table_of: int):
+        """Lance le calcul du classement en arrière-plan, un calcul encore en cours
+        pour une période précédente étant annulé"""
+        self.cancel_worker()
+        self.worker = RankingWorker(start, end, table_of)
+        self.worker.signals.progress.connect(self.title.setText)
+        self.worker.signals.finished.connect(partial(self.display_ranking, start, end, table_of))
+        self.worker.signals.failed.connect(self.title.setText)
+        self.thread_pool.start(self.worker)
+
+    def display_ranking(self, start: datetime, end: datetime, table_of: int, rank):
         """Lance les mises à jour d'affichage : graph, score et titre"""
-        self.update_graph(start, end, table_of)
+        self.worker = None
+        self.rank = rank
+        self.update_graph()
         clear_layout(self.score_layout)
         self.update_score()
         self.update_title(start, end, table_of)
 
-    def update_graph(self, start: datetime, end: datetime, table_of: int):
+    def update_graph(self):
         """Charge le graphique"""
-        self.rank = Ranking(start, end, table_of)
-        rank: dict[list[str]] = self.rank.ranking.to_dict(orient="list")
+        rank: dict[str, list[int]] = self.rank.ranking_per_player()
         for liste in rank.values():
             liste.insert(0, 0)
         self.refresh_graph.emit(rank, self.rank.number_of_game + 1, "ranking")
@@ -125,11 +194,12 @@ class RankingWindow(QWidget):
 
     def get_last_ranking(self) -> list[tuple[str, int]]:
         """Récupération du dernier score de chaque joueur"""
-        return [(nickname, score.iloc[-1]) for (nickname, score) in self.rank.ranking.iteritems()]
+        return [(nickname, score[-1] if score else 0) for nickname, score in self.rank.ranking_per_player().items()]
 
 
 if __name__ == '__main__':
     app = QApplication()
+    install_event_loop(app)
     window = RankingWindow()
     window.show()
-    app.exec()
+    run_event_loop()
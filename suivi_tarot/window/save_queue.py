@@ -0,0 +1,68 @@
+"""Enregistrement en arrière-plan des parties validées, à partir de la file d'attente sur disque
+(suivi_tarot.api.save_queue)"""
+
+from PySide6.QtCore import Signal, QObject, QRunnable, QThreadPool
+
+from suivi_tarot.api.save_queue import enqueue_game, get_pending_games, save_pending_game, is_permanent_failure, \
+    set_aside_game
+
+
+class SaveSignals(QObject):
+    """Signaux émis par SaveWorker, reçus dans le thread de l'interface"""
+    saved = Signal(int)
+    failed = Signal(str)
+
+
+class SaveWorker(QRunnable):
+    """Enregistrement en bdd, hors du thread de l'interface, des parties de la file d'attente.
+    Une partie dont l'enregistrement échouera à chaque tentative est mise de côté et les suivantes
+    sont enregistrées ; toute autre erreur (bdd indisponible) arrête l'enregistrement, les parties
+    restantes étant conservées dans la file."""
+
+    def __init__(self, signals: SaveSignals):
+        super().__init__()
+
+        self.signals = signals
+
+    def run(self):
+        for path in get_pending_games():
+            try:
+                game_id = save_pending_game(path)
+            except Exception as error:
+                if is_permanent_failure(error):
+                    failed_path = set_aside_game(path)
+                    self.signals.failed.emit(f"Erreur lors de l'enregistrement de la partie : {error}\n"
+                                             f"Elle ne peut pas être enregistrée et a été déplacée dans "
+                                             f"{failed_path.parent}.")
+                    continue
+                self.signals.failed.emit(f"Erreur lors de l'enregistrement de la partie : {error}\n"
+                                         f"Elle reste dans la file et sera de nouveau enregistrée lors de "
+                                         f"l'enregistrement de la prochaine partie ou au prochain lancement.")
+                return
+            self.signals.saved.emit(game_id)
+
+
+class SaveQueue(QObject):
+    """File d'attente des parties validées : chaque partie est écrite sur le disque puis enregistrée
+    en bdd par un unique thread d'écriture, dans l'ordre de validation"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+
+        self.signals = SaveSignals()
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+
+    def submit(self, game: dict, players: list[str], donnes: list[tuple[dict, list[tuple[str, str, int]]]]):
+        """Ajoute une partie à la file puis lance son enregistrement"""
+        enqueue_game(game, players, donnes)
+        self.flush()
+
+    def flush(self):
+        """Lance l'enregistrement des parties en attente, dont celles d'un lancement précédent"""
+        if get_pending_games():
+            self.thread_pool.start(SaveWorker(self.signals))
+
+    def wait(self):
+        """Attend la fin des enregistrements en cours"""
+        self.thread_pool.waitForDone()
@@ -1,37 +1,14 @@
-from datetime import datetime, timedelta
+import asyncio
+from datetime import datetime
 
 from PySide6.QtCore import QSize, Qt, Signal
 from PySide6.QtGui import QFont
 from PySide6.QtWidgets import QApplication, QWidget, QTabWidget, QVBoxLayout, QRadioButton, QComboBox, QHBoxLayout, \
     QLabel, QGridLayout, QDateTimeEdit, QPushButton
 
-from suivi_tarot.database.clients import get_distinct_years, get_min_max_dates_games
-
-
-period_dict = {"type": ["Mois", "Trimestre", "Semestre"],
-               "month": ["janvier", "février", "mars", "avril", "mai", "juin", "juillet", "août", "septembre",
-                         "octobre",
-                         "novembre", "décembre"],
-               "quarter": ["janvier - mars", "avril - juin", "juillet - septembre", "octobre - décembre"],
-               "semester": ["janvier - juin", "juillet - décembre"],
-               "janvier": [1, 1],
-               "février": [2, 2],
-               "mars": [3, 3],
-               "avril": [4, 4],
-               "mai": [5, 5],
-               "juin": [6, 6],
-               "juillet": [7, 7],
-               "août": [8, 8],
-               "septembre": [9, 9],
-               "octobre": [10, 10],
-               "novembre": [11, 11],
-               "décembre": [12, 12],
-               "janvier - mars": [1, 3],
-               "avril - juin": [4, 6],
-               "juillet - septembre": [7, 9],
-               "octobre - décembre": [10, 12],
-               "janvier - juin": [1, 6],
-               "juillet - décembre": [7, 12]}
+from suivi_tarot.api.utils import period_dict, get_first_and_last_day_of_period
+from suivi_tarot.database.async_clients import get_distinct_years, get_min_max_dates_games
+from suivi_tarot.window.event_loop import install_event_loop, run_event_loop, start_task
 
 
 def font_bold() -> QFont:
@@ -41,16 +18,6 @@ def font_bold() -> QFont:
     return font
 
 
-def get_first_and_last_day_of_period(period: str, year: int) -> tuple[datetime, datetime]:
-    """Retourne au format datetime le premier et le dernier jour d'une période"""
-    start, end = period_dict.get(period)
-    start = datetime(year, start, 1)
-    end = datetime(year, end, 28, 23, 59, 59)
-    next_month = end + timedelta(days=4)
-    end = next_month - timedelta(days=next_month.day)
-    return start, end
-
-
 class CustomLabel(QLabel):
     """Création de label avec une police en gras et une longueur
     maximale de 40"""
@@ -82,6 +49,7 @@ class SelectDates(QWidget):
         self.setup_ui()
         self.resize(269, 176)
         self.setWindowTitle("Recherche parties")
+        self.loading = start_task(self.load_dates())
 
     def setup_ui(self):
         self.create_widgets()
@@ -135,28 +103,16 @@ class SelectDates(QWidget):
 
         self.radio_year.setChecked(True)
         self.radio_year.setMaximumSize(QSize(60, 16777215))
-        self.available_years = get_distinct_years()
-        if not self.available_years:
-            self.available_years = [str(datetime.now().year)]
-        self.cbx_year.addItems(self.available_years)
-
         self.cbx_type_period.addItems(period_dict["type"])
-        self.cbx_year_period.addItems(self.available_years)
         self.update_cbx_choice_period()
 
         self.dte_from.setCalendarPopup(True)
         self.dte_to.setCalendarPopup(True)
 
-        min_date, max_date = get_min_max_dates_games()
-        if min_date:
-            min_date = min_date.replace(hour=0, minute=0, second=0)
-            max_date = max_date.replace(hour=23, minute=59, second=59)
-            self.dte_from.setDateTime(min_date)
-            self.dte_to.setDateTime(max_date)
-        else:
-            year = datetime.now().year
-            self.dte_from.setDateTime(datetime(year, 1, 1, 0, 0, 0))
-            self.dte_to.setDateTime(datetime(year, 12, 31, 23, 59, 59))
+        # Année en cours en attendant la lecture des années et dates des parties (load_dates)
+        self.display_years([])
+        self.display_dates(None, None)
+        self.btn_search.setEnabled(False)
 
     def create_layouts(self):
         self.main_layout = QVBoxLayout(self)
@@ -201,6 +157,35 @@ class SelectDates(QWidget):
         self.main_layout.addWidget(self.tab_select_date)
         self.main_layout.addLayout(self.button_layout)
 
+    async def load_dates(self):
+        """Lit en même temps, sans figer la fenêtre, les années où au moins une partie a été jouée
+        et les dates de la première et de la dernière partie, puis les affiche"""
+        try:
+            years, (min_date, max_date) = await asyncio.gather(get_distinct_years(), get_min_max_dates_games())
+            self.display_years(years)
+            self.display_dates(min_date, max_date)
+        finally:
+            self.btn_search.setEnabled(True)
+
+    def display_years(self, years: list[str]):
+        """Propose les années où au moins une partie a été jouée, à défaut l'année en cours"""
+        self.available_years = years or [str(datetime.now().year)]
+        for cbx in (self.cbx_year, self.cbx_year_period):
+            cbx.clear()
+            cbx.addItems(self.available_years)
+
+    def display_dates(self, min_date: datetime | None, max_date: datetime | None):
+        """Propose comme période libre celle des parties enregistrées, à défaut l'année en cours"""
+        if min_date:
+            min_date = min_date.replace(hour=0, minute=0, second=0)
+            max_date = max_date.replace(hour=23, minute=59, second=59)
+            self.dte_from.setDateTime(min_date)
+            self.dte_to.setDateTime(max_date)
+        else:
+            year = datetime.now().year
+            self.dte_from.setDateTime(datetime(year, 1, 1, 0, 0, 0))
+            self.dte_to.setDateTime(datetime(year, 12, 31, 23, 59, 59))
+
     def setup_connections(self):
         self.cbx_type_period.currentIndexChanged.connect(self.update_cbx_choice_period)
         self.btn_search.clicked.connect(self.dispatch_action)
@@ -266,6 +251,7 @@ class SelectDates(QWidget):
 
 if __name__ == '__main__':
     app = QApplication()
+    install_event_loop(app)
     window = SelectDates()
     window.show()
-    app.exec()
+    run_event_loop()
@@ -2,15 +2,17 @@ from PySide6.QtCore import Qt
 from PySide6.QtWidgets import QWidget, QLabel, QPushButton, QVBoxLayout, QHBoxLayout, QListWidget, QAbstractItemView
 
 from suivi_tarot.database.clients import get_active_players
+from suivi_tarot.window.save_queue import SaveQueue
 from suivi_tarot.window.table import TableWindow
 
 
 # noinspection PyAttributeOutsideInit
 class SelectPlayerWindow(QWidget):
     """Fenêtre de sélection des joueurs participants à la session"""
-    def __init__(self):
+    def __init__(self, save_queue: SaveQueue):
         super().__init__()
 
+        self.save_queue = save_queue
         self.selected_players = set()
         self.selection_order = {}
         self.resize(176, 344)
@@ -86,7 +88,7 @@ class SelectPlayerWindow(QWidget):
         """Ouvre la fenêtre d'enregistrement d'une session"""
         player_table = self.create_list_player_sorted()
 
-        self.table = TableWindow(player_table)
+        self.table = TableWindow(player_table, self.save_queue)
         self.table.setWindowModality(Qt.ApplicationModal)
         self.close()
         self.table.show()
@@ -111,6 +113,6 @@ if __name__ == '__main__':
 
 
     app = QApplication()
-    window = SelectPlayerWindow()
+    window = SelectPlayerWindow(SaveQueue())
     window.show()
     app.exec()
@@ -0,0 +1,99 @@
+"""Mesure du lancement de l'application (main de suivi_tarot.__main__) : temps jusqu'à l'affichage
+de la fenêtre principale (médiane de plusieurs lancements) et coût d'import de chaque module, chaque
+lancement se faisant dans un nouvel interpréteur. La mesure remplace l'ouverture de la bdd, qui suit
+l'affichage : la bdd n'est pas mise à jour. Echoue si l'affichage de la fenêtre principale charge un
+des modules lourds de LAZY_MODULES, qui ne doivent l'être qu'à l'ouverture de la bdd ou de la
+fonctionnalité qui les utilise. Nécessite une bdd configurée dans settings.json :
+python -m suivi_tarot.window.startup_benchmark [nombre de lancements]"""
+
+import json
+import re
+import statistics
+import subprocess
+import sys
+
+from suivi_tarot.api.utils import ROOT_FOLDER, SETTINGS_FILE
+from suivi_tarot.api.settings import get_path_database
+
+RUNS = 5
+# Modules lourds qui ne doivent pas être chargés par l'affichage de la fenêtre principale
+# (NumPy n'y figure pas : PySide6 le charge lui-même lorsqu'il est installé)
+LAZY_MODULES = ("sqlalchemy", "pandas", "matplotlib")
+# Nombre de modules affichés, par coût d'import décroissant
+TOP_MODULES = 15
+
+# Lance main en remplaçant l'ouverture de la bdd, premier évènement traité après l'affichage
+# de la fenêtre, par la mesure
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from PySide6.QtWidgets import QApplication
+from suivi_tarot.window.main_window import MainWindow
+from suivi_tarot.__main__ import main
+
+def measure(window):
+    print(json.dumps({"elapsed": time.perf_counter() - start, "modules": sorted(sys.modules)}))
+    QApplication.exit(0)
+
+MainWindow.open_database = measure
+sys.exit(main())
+"""
+
+
+def launch(import_time: bool = False) -> tuple[dict, str]:
+    """Lance l'application jusqu'à l'affichage de la fenêtre principale dans un nouvel interpréteur.
+    Retourne le temps écoulé (s) et les modules chargés, ainsi que la sortie d'erreur, contenant
+    le coût d'import de chaque module si import_time est vrai"""
+    options = ["-X", "importtime"] if import_time else []
+    process = subprocess.run([sys.executable, *options, "-c", STARTUP_SCRIPT], cwd=ROOT_FOLDER,
+                             capture_output=True, text=True)
+    if process.returncode:
+        sys.exit(f"Echec du lancement de l'application :\n{process.stderr}")
+    return json.loads(process.stdout.splitlines()[-1]), process.stderr
+
+
+def parse_import_time(output: str) -> tuple[dict[str, int], dict[str, str]]:
+    """Retourne, d'après la sortie de python -X importtime, le coût d'import cumulé (µs)
+    de chaque module et le module ayant déclenché son import"""
+    cost, parent = {}, {}
+    children: list[tuple[int, str]] = []
+    for line in output.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)", line)
+        if not match:
+            continue
+        depth, module = len(match.group(2)), match.group(3)
+        cost[module] = int(match.group(1))
+        # Les imports d'un module sont listés avant lui, avec un niveau d'indentation de plus
+        while children and children[-1][0] > depth:
+            parent[children.pop()[1]] = module
+        children.append((depth, module))
+    return cost, parent
+
+
+def importer(module: str, parent: dict[str, str]) -> str:
+    """Retourne le premier module de l'application dans la chaîne d'imports d'un module"""
+    while module in parent and not module.startswith("suivi_tarot"):
+        module = parent[module]
+    return module
+
+
+if __name__ == '__main__':
+    # Sans bdd valide, main ouvrirait la fenêtre de connexion à la place de la fenêtre principale
+    if not SETTINGS_FILE.exists() or not get_path_database(".sqlite3")[1]:
+        sys.exit("Aucune bdd valide dans settings.json : lancer l'application une première fois")
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else RUNS
+    elapsed = [launch()[0]["elapsed"] for _ in range(runs)]
+    print(f"Affichage de la fenêtre principale : {statistics.median(elapsed) * 1000:.0f} ms "
+          f"(médiane de {runs} lancements, de {min(elapsed) * 1000:.0f} à {max(elapsed) * 1000:.0f} ms)")
+
+    result, output = launch(import_time=True)
+    cost, parent = parse_import_time(output)
+    print(f"\nCoût d'import cumulé des {TOP_MODULES} modules les plus coûteux :")
+    for module, microseconds in sorted(cost.items(), key=lambda v: v[1], reverse=True)[:TOP_MODULES]:
+        print(f"{microseconds / 1000:8.1f} ms  {module}")
+
+    loaded = [module for module in LAZY_MODULES if module in result["modules"]]
+    if loaded:
+        sys.exit("\nModules lourds chargés au lancement : "
+                 + ", ".join(f"{module} (importé par {importer(module, parent)})" for module in loaded))
+    print(f"\nAucun module lourd chargé au lancement ({', '.join(LAZY_MODULES)})")
@@ -6,12 +6,10 @@ from PySide6.QtGui import QFont, QCloseEvent
 from PySide6.QtWidgets import QWidget, QTableWidget, QVBoxLayout, QHeaderView, QPushButton, QLabel, QHBoxLayout, \
     QSizePolicy, QGridLayout, QSpacerItem, QMessageBox
 
-from suivi_tarot.api.calcul import conversion_contract, conversion_poignee
-from suivi_tarot.database.clients import insert_new_game, insert_players_game, insert_donne, insert_preneur, \
-    insert_appele, insert_pnj, insert_defense
-from suivi_tarot.database.models import Donne
+from suivi_tarot.api.calcul import conversion_contract, conversion_poignee, encode_donne
 from suivi_tarot.window.graph_ranking import GraphWidget
 from suivi_tarot.window.pnj import PnjWindow
+from suivi_tarot.window.save_queue import SaveQueue
 from suivi_tarot.window.donne import DetailsWindow
 from suivi_tarot.api.utils import HEADER_3_4, HEADER_5, HEADER_6, get_random_item_with_constraint
 from suivi_tarot.api.settings import get_player_color_graph
@@ -44,10 +42,11 @@ class TableWindow(QWidget):
 
     refresh_graph = Signal(dict, int, str)
 
-    def __init__(self, players):
+    def __init__(self, players, save_queue: SaveQueue):
         super().__init__()
 
         self.players = players
+        self.save_queue = save_queue
         self.available_pnj = list(players)
         self.number_players = len(players)
         self.score = {k: [0] for k in players}
@@ -295,36 +294,25 @@ class TableWindow(QWidget):
             self.score_layout.addWidget(classement[i][2], i, 1)
 
     def valid_game(self):
-        """Enregistre en bdd la partie et donnes associées"""
+        """Ajoute la partie et les donnes associées à la file d'attente d'enregistrement puis ferme
+        la fenêtre, l'enregistrement en bdd (une seule transaction) se faisant en arrière-plan"""
         if self.tab_donne.rowCount() <= 2:
             return
 
         choice = self.popup_validation(QMessageBox.Question, "Terminer la partie ?", QMessageBox.Yes)
         if choice == QMessageBox.Yes:
-            game_id = self.save_game()
-            self.save_players(game_id)
-            for row in range(self.tab_donne.rowCount() - 1):
-                donne_id = self.save_donne(game_id, row)
-                self.save_preneur(donne_id)
-                self.save_appele(donne_id)
-                self.save_pnj(donne_id)
-                self.save_defense(donne_id)
+            donnes = [(self.donne_values(row), self.donne_roles()) for row in range(self.tab_donne.rowCount() - 1)]
+            self.save_queue.submit(self.game_values(), self.players, donnes)
             self.saved = True
             self.close()
 
-    def save_game(self) -> int:
-        """Enregistre la partie, soit la date et le type de jeu (à 3, 4 ou 5 joueurs).
-        Retourne l'id de la partie ainsi enregistrée"""
-        partie = {"date_": datetime.now(),
-                  "table_": self.number_players if self.number_players < 6 else 5}
-        return insert_new_game(**partie)
+    def game_values(self) -> dict:
+        """Retourne la partie à enregistrer, soit la date et le type de jeu (à 3, 4 ou 5 joueurs)"""
+        return {"date_": datetime.now(),
+                "table_": self.number_players if self.number_players < 6 else 5}
 
-    def save_players(self, game_id: int):
-        """Enregistre les joueurs participants"""
-        insert_players_game(game_id, self.players)
-
-    def save_donne(self, game_id: int, row: int) -> int:
-        """Enregistre une donne de la partie et retourne son id généré"""
+    def donne_values(self, row: int) -> dict:
+        """Retourne les valeurs à enregistrer d'une donne de la partie"""
         column = ["preneur", "contrat", "nb_bout", "point", "poignee", "petit", "petit_chelem", "grand_chelem"]
         if self.number_players > 4:
             column.insert(4, "tete")
@@ -339,33 +327,25 @@ class TableWindow(QWidget):
             self.dict_donne["pnj"] = self.tab_donne.cellWidget(row, 0).text()
         else:
             self.dict_donne["pnj"] = None
-        donne = Donne(game_id=game_id,
-                      nb_bout=int(self.dict_donne["nb_bout"]),
-                      contract=conversion_contract(self.dict_donne["contrat"]),
-                      tete=self.dict_donne["tete"],
-                      point=float(self.dict_donne["point"]),
-                      petit=self.dict_donne["petit"],
-                      poignee=conversion_poignee(self.dict_donne["poignee"]),
-                      petit_chelem=self.dict_donne["petit_chelem"],
-                      grand_chelem=self.dict_donne["grand_chelem"])
-        return insert_donne(donne)
-
-    def save_preneur(self, donne_id: int):
-        """Enregistre le preneur d'une donne"""
-        insert_preneur(donne_id, self.dict_donne["preneur"])
-
-    def save_appele(self, donne_id: int):
-        """Enregistre l'appelé d'une donne (partie à 5 ou 6 joueurs)"""
+        return {"nb_bout": int(self.dict_donne["nb_bout"]),
+                "contract": encode_donne("contract", conversion_contract(self.dict_donne["contrat"])),
+                "tete": encode_donne("tete", self.dict_donne["tete"]),
+                "point": float(self.dict_donne["point"]),
+                "petit": encode_donne("petit", self.dict_donne["petit"]),
+                "poignee": encode_donne("poignee", conversion_poignee(self.dict_donne["poignee"])),
+                "petit_chelem": encode_donne("petit_chelem", self.dict_donne["petit_chelem"]),
+                "grand_chelem": encode_donne("grand_chelem", self.dict_donne["grand_chelem"])}
+
+    def donne_roles(self) -> list[tuple[str, str, int]]:
+        """Retourne le preneur, l'appelé (partie à 5 ou 6 joueurs), le joueur n'ayant pas joué
+        la donne (partie à 6 joueurs) et les joueurs ayant joué en défense la dernière donne
+        lue par donne_values"""
+        roles = [(self.dict_donne["preneur"], "preneur", 0)]
         if self.dict_donne["appele"]:
-            insert_appele(donne_id, self.dict_donne["appele"])
-
-    def save_pnj(self, donne_id: int):
-        """Enregistre le joueur n'ayant pas joué la donne (partie à 6 joueurs)"""
+            roles.append((self.dict_donne["appele"], "appele", 0))
         if self.dict_donne["pnj"]:
-            insert_pnj(donne_id, self.dict_donne["pnj"])
+            roles.append((self.dict_donne["pnj"], "pnj", 0))
 
-    def save_defense(self, donne_id: int):
-        """Enregistre les joueurs ayant joué en défense une donne"""
         defense = list(self.players)
         for player in self.players:
             if player in (self.dict_donne.get("preneur", ""),
@@ -373,8 +353,7 @@ class TableWindow(QWidget):
                           self.dict_donne.get("pnj", "")):
                 defense.remove(player)
 
-        for number, player in enumerate(defense, 1):
-            insert_defense(donne_id, player, number)
+        return roles + [(player, "defense", number) for number, player in enumerate(defense, 1)]
 
     @staticmethod
     def popup_validation(icon: QMessageBox.Icon, text: str, default_btn: QMessageBox.StandardButton):
@@ -394,6 +373,6 @@ if __name__ == "__main__":
     from suivi_tarot.api.utils import PLAYERS
 
     app = QApplication()
-    window = TableWindow(PLAYERS)
+    window = TableWindow(PLAYERS, SaveQueue())
     window.show()
     app.exec()